@@ -0,0 +1,12 @@
+# Engine perhitungan Asuransi Banjir Askrindo yang dipakai oleh halaman Streamlit.
+from .rates import RateTable, load_rate_table, apply_rate_table
+from .pipeline import PipelineError, PipelineResult, run_pipeline
+
+__all__ = [
+    "RateTable",
+    "load_rate_table",
+    "apply_rate_table",
+    "PipelineError",
+    "PipelineResult",
+    "run_pipeline",
+]
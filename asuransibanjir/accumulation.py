@@ -0,0 +1,122 @@
+# Akumulasi eksposur: total polis, TSI dan PML dalam radius tertentu di sekitar setiap lokasi.
+#
+# Polis dengan koordinat yang sama digabung menjadi satu lokasi, lalu setiap lokasi
+# dicari tetangganya dengan STRtree pada koordinat Mercator (meter). Skala Mercator
+# bergantung latitude, jadi radius query per lokasi = radius / cos(latitude).
+import numpy as np
+import shapely
+
+from .pipeline import PML_COL, TSI_COL
+from .spatial import LAT_COL, LON_COL, location_ids
+
+EARTH_RADIUS_M = 6_371_008.8
+DEFAULT_RADII = (200, 500, 1000)
+COUNT_COL = "Jumlah Polis"
+# Batas jumlah pasangan lokasi per batch query (memori ~ 24 byte per pasangan)
+PAIR_BUDGET = 5_000_000
+FIRST_BATCH = 10_000
+# Lokasi diurutkan per sel ini (meter) agar satu batch berisi lokasi yang berdekatan
+SORT_CELL_M = 10_000
+
+
+def radius_label(radius):
+    # 200 -> "200 m", 1000 -> "1 km"
+    return f"{radius / 1000:g} km" if radius >= 1000 else f"{radius:g} m"
+
+
+def accumulation_col(measure, radius):
+    return f"{measure} {radius_label(radius)}"
+
+
+def _mercator(lon, lat):
+    phi = np.radians(lat)
+    return EARTH_RADIUS_M * np.radians(lon), EARTH_RADIUS_M * np.log(np.tan(np.pi / 4 + phi / 2)), np.cos(phi)
+
+
+def location_exposure(final):
+    """Gabungkan polis per koordinat unik: Jumlah Polis, TSI dan PML per lokasi.
+
+    Lokasi diurutkan per sel ``SORT_CELL_M`` sehingga lokasi yang berdekatan
+    juga berdekatan di frame hasil.
+    """
+    loc_id, locations = location_ids(final)
+    locations[COUNT_COL] = np.bincount(loc_id, minlength=len(locations))
+    for col in (TSI_COL, PML_COL):
+        if col in final.columns:
+            values = np.nan_to_num(final[col].to_numpy(dtype=float))
+            locations[col] = np.bincount(loc_id, weights=values, minlength=len(locations))
+
+    locations = locations.dropna(subset=[LON_COL, LAT_COL])
+    x, y, _ = _mercator(locations[LON_COL].to_numpy(), locations[LAT_COL].to_numpy())
+    order = np.lexsort((x // SORT_CELL_M, y // SORT_CELL_M))
+    return locations.iloc[order].reset_index(drop=True)
+
+
+def _neighbour_pairs(x, y, cos_lat, radius):
+    # Pasangan (lokasi, tetangga, jarak meter) dalam radius, per batch; termasuk lokasi itu sendiri
+    points = shapely.points(x, y)
+    tree = shapely.STRtree(points)
+    start, batch = 0, FIRST_BATCH
+    while start < len(points):
+        stop = min(start + batch, len(points))
+        source, target = tree.query(
+            points[start:stop], predicate="dwithin", distance=radius / cos_lat[start:stop],
+        )
+        source += start
+        distance = np.hypot(x[source] - x[target], y[source] - y[target]) * cos_lat[source]
+        yield source, target, distance
+        # Ukuran batch berikutnya menyesuaikan kepadatan agar jumlah pasangan mendekati PAIR_BUDGET
+        batch = int(np.clip(batch * PAIR_BUDGET / max(len(source), 1), 100, 1_000_000))
+        start = stop
+
+
+def accumulate_exposure(final, radii=DEFAULT_RADII):
+    """Total Jumlah Polis, TSI dan PML dalam setiap radius (meter) di sekitar setiap lokasi.
+
+    Mengembalikan frame per lokasi (lihat ``location_exposure``) dengan kolom
+    tambahan ``"<ukuran> <radius>"``, mis. ``"PML 500 m"``. Semua radius
+    dihitung dari satu query dengan radius terbesar.
+    """
+    locations = location_exposure(final)
+    measures = [col for col in (COUNT_COL, TSI_COL, PML_COL) if col in locations.columns]
+    radii = sorted(radii)
+    n = len(locations)
+    totals = {(measure, radius): np.zeros(n) for measure in measures for radius in radii}
+    if n:
+        weights = {measure: locations[measure].to_numpy(dtype=float) for measure in measures}
+        x, y, cos_lat = _mercator(locations[LON_COL].to_numpy(), locations[LAT_COL].to_numpy())
+        for source, target, distance in _neighbour_pairs(x, y, cos_lat, radii[-1]):
+            for radius in radii:
+                inside = distance <= radius
+                src, tgt = source[inside], target[inside]
+                for measure in measures:
+                    totals[measure, radius] += np.bincount(src, weights=weights[measure][tgt], minlength=n)
+
+    for (measure, radius), values in totals.items():
+        locations[accumulation_col(measure, radius)] = values.astype(np.int64) if measure == COUNT_COL else values
+    return locations
+
+
+def top_hotspots(accumulation, radius=1000, n=10, measure=PML_COL):
+    """``n`` lokasi dengan akumulasi ``measure`` terbesar dalam ``radius``.
+
+    Dipilih berurutan dari nilai terbesar; lokasi yang lingkarannya tumpang
+    tindih dengan hotspot yang sudah terpilih (jarak < 2 x radius) dilewati,
+    sehingga setiap hotspot mewakili konsentrasi yang berbeda.
+    """
+    cols = [accumulation_col(m, radius) for m in (COUNT_COL, TSI_COL, PML_COL)
+            if accumulation_col(m, radius) in accumulation.columns]
+    values = accumulation[accumulation_col(measure, radius)].to_numpy()
+    order = np.argsort(-values, kind="stable")
+    x, y, cos_lat = _mercator(accumulation[LON_COL].to_numpy(), accumulation[LAT_COL].to_numpy())
+
+    available = np.ones(len(accumulation), dtype=bool)
+    chosen = []
+    while len(chosen) < n and available.any():
+        pos = order[np.argmax(available[order])]
+        chosen.append(pos)
+        available &= np.hypot(x - x[pos], y - y[pos]) * cos_lat[pos] >= 2 * radius
+
+    hotspots = accumulation.iloc[chosen][[LON_COL, LAT_COL, *cols]].reset_index(drop=True)
+    hotspots.insert(0, "Peringkat", np.arange(1, len(hotspots) + 1))
+    return hotspots
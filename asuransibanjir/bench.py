@@ -0,0 +1,266 @@
+# Benchmark pipeline dengan portfolio dan layer bahaya sintetis.
+#
+#   python -m asuransibanjir.bench --sizes 10k,100k,1M,5M --polygons 300 --vertices 200
+#
+# Setiap ukuran menambahkan satu baris JSON ke --results (default benchmarks.jsonl)
+# berisi waktu per tahap, lalu dibandingkan dengan run sebelumnya untuk
+# konfigurasi yang sama (ukuran, jumlah poligon, jumlah titik sudut, seed).
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from . import export
+from .accumulation import accumulate_exposure
+from .maps import build_deck
+from .pipeline import load_portfolio, prepare_portfolio, score_portfolio
+from .simulation import simulate_losses, simulation_exposure
+from .spatial import LAT_COL, LON_COL, load_hazard_layers, read_hazard_zip, spatial_join
+from .summaries import build_cube, summaries_from_cube
+
+DEFAULT_SIZES = "10k,100k,1M,5M"
+DEFAULT_RESULTS = "benchmarks.jsonl"
+
+# Pusat kota (Longitude, Latitude): titik portfolio dan poligon bahaya mengumpul di sekitarnya
+CITIES = [
+    (106.85, -6.20),   # Jakarta
+    (112.75, -7.25),   # Surabaya
+    (107.61, -6.91),   # Bandung
+    (110.42, -6.97),   # Semarang
+    (98.67, 3.59),     # Medan
+    (104.75, -2.98),   # Palembang
+    (119.42, -5.14),   # Makassar
+    (116.85, -1.27),   # Balikpapan
+    (115.21, -8.65),   # Denpasar
+    (101.45, 0.51),    # Pekanbaru
+]
+CITY_SPREAD_DEG = 0.15
+OKUPASI = ["Residensial", "Komersial", "Industrial", "Lainnya"]
+KODE_OKUPASI = ["2931", "4,12", "#VALUE!", "5120", "4110", "2976"]
+UY_YEARS = [2021, 2022, 2023, 2024]
+# Sebagian kecil data dibuat kotor seperti data asli
+MESSY_FRACTION = 0.05
+MISSING_FRACTION = 0.001
+
+
+def parse_size(text):
+    # "10k" -> 10_000, "1M" -> 1_000_000
+    text = text.strip()
+    factor = {"k": 1_000, "m": 1_000_000}.get(text[-1:].lower(), 1)
+    return int(float(text[:-1] if factor > 1 else text) * factor)
+
+
+def _format_dates(dates):
+    # strftime hanya pada tanggal unik (jumlahnya ribuan, bukan jutaan)
+    codes, uniques = pd.factorize(dates)
+    return pd.Index(uniques).strftime("%d/%m/%Y").to_numpy(dtype=object)[codes]
+
+
+def synthetic_portfolio(rows, seed=0):
+    """Portfolio sintetis dengan kolom seperti file upload asli (semua berupa teks CSV).
+
+    Titik mengumpul di sekitar ``CITIES`` di Indonesia. Sebagian kecil
+    Latitude memakai koma desimal dan sebagian kecil koordinat kosong, agar
+    tahap pembersihan ikut teruji.
+    """
+    rng = np.random.default_rng(seed)
+    city = rng.integers(len(CITIES), size=rows)
+    centers = np.asarray(CITIES)[city]
+    lon = np.round(centers[:, 0] + rng.normal(0, CITY_SPREAD_DEG, rows), 6)
+    lat = np.round(centers[:, 1] + rng.normal(0, CITY_SPREAD_DEG, rows), 6)
+
+    uy = rng.choice(UY_YEARS, size=rows)
+    inception = pd.to_datetime(uy.astype(str), format="%Y") + pd.to_timedelta(rng.integers(365, size=rows), unit="D")
+    expiry = inception + pd.Timedelta(days=365)
+
+    df = pd.DataFrame({
+        LAT_COL: lat.astype(str).astype(object),
+        LON_COL: lon,
+        "TSI IDR": pd.Series(rng.integers(50_000_000, 5_000_000_000, size=rows)).map("{:,}".format),
+        "Kategori Okupasi": rng.choice(OKUPASI, size=rows),
+        "Jumlah Lantai": rng.integers(0, 4, size=rows).astype(float),
+        "UY": uy,
+        "Kode Okupasi_mod": rng.choice(KODE_OKUPASI, size=rows),
+        "INCEPTION DATE": _format_dates(inception),
+        "EXPIRY DATE": _format_dates(expiry),
+    })
+    messy = rng.random(rows) < MESSY_FRACTION
+    df.loc[messy, LAT_COL] = df.loc[messy, LAT_COL].str.replace(".", ",", regex=False)
+    df.loc[rng.random(rows) < MISSING_FRACTION, LAT_COL] = None
+    return df
+
+
+def synthetic_hazard(polygons=300, vertices=200, seed=0):
+    """Layer bahaya sintetis: poligon gridcode 1/2/3 di sekitar ``CITIES``.
+
+    Setiap poligon berbentuk bintang tidak beraturan dengan ``vertices`` titik
+    sudut, sehingga kompleksitas layer bisa diatur. Mengembalikan GeoDataFrame
+    (EPSG:4326).
+    """
+    rng = np.random.default_rng(seed + 1)
+    city = rng.integers(len(CITIES), size=polygons)
+    centers = np.asarray(CITIES)[city] + rng.normal(0, CITY_SPREAD_DEG, (polygons, 2))
+    radius = rng.uniform(0.005, 0.05, size=polygons)
+
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    wobble = 1 + 0.3 * rng.uniform(-1, 1, size=(polygons, vertices))
+    x = centers[:, [0]] + radius[:, None] * wobble * np.cos(angles)
+    y = centers[:, [1]] + radius[:, None] * wobble * np.sin(angles)
+    rings = np.stack([x, y], axis=-1)
+    geometry = shapely.polygons(np.concatenate([rings, rings[:, :1]], axis=1))
+
+    return gpd.GeoDataFrame(
+        {"gridcode": rng.integers(1, 4, size=polygons)},
+        geometry=geometry,
+        crs="EPSG:4326",
+    )
+
+
+def hazard_zip_bytes(gdf_shape, name="sintetis"):
+    # Shapefile dalam zip, sama seperti yang diupload ke halaman Streamlit
+    with tempfile.TemporaryDirectory() as tmpdir:
+        gdf_shape.to_file(os.path.join(tmpdir, f"{name}.shp"))
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w") as zip_ref:
+            for file in sorted(os.listdir(tmpdir)):
+                zip_ref.write(os.path.join(tmpdir, file), file)
+    return output.getvalue()
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def _peak_rss_mb():
+    # ru_maxrss dalam KB di Linux; nilai puncak sejak proses dimulai
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1)
+
+
+def run_benchmark(rows, polygons=300, vertices=200, seed=0):
+    """Jalankan semua tahap sekali untuk portfolio ``rows`` baris.
+
+    Mengembalikan dict hasil (satu baris file hasil). Data sintetis dibuat
+    sebelum pengukuran dan tidak ikut dihitung waktunya.
+    """
+    csv_bytes = synthetic_portfolio(rows, seed).to_csv(index=False).encode("utf-8")
+    hazard_zips = [("sintetis.zip", hazard_zip_bytes(synthetic_hazard(polygons, vertices, seed)))]
+
+    seconds = {}
+
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        seconds[stage] = round(time.perf_counter() - start, 4)
+        return result
+
+    layers, _ = timed("hazard_read", load_hazard_layers, hazard_zips, read_hazard_zip)
+    df = timed("ingest", load_portfolio, io.BytesIO(csv_bytes), "csv")
+    del csv_bytes
+    df = timed("cleaning", prepare_portfolio, df)[0]
+    final, grid_col = timed("sjoin", spatial_join, df, layers)
+    del df
+    final, _ = timed("rating", score_portfolio, final, grid_col)
+    timed("aggregation", lambda frame: summaries_from_cube(build_cube(frame)), final)
+    timed("accumulation", accumulate_exposure, final)
+    timed("simulation", lambda frame: simulate_losses(simulation_exposure(frame), seed=seed), final)
+    for fmt in ("csv.gz", "parquet"):
+        timed(f"export_{fmt}", export.export_bytes, final, fmt)
+    payload = timed("map_payload", lambda frame: build_deck(frame).to_json(), final)
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "rows": rows,
+        "polygons": polygons,
+        "vertices": vertices,
+        "seed": seed,
+        "seconds": seconds,
+        "total": round(sum(seconds.values()), 4),
+        "map_payload_mb": round(len(payload) / 1e6, 2),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _config(record):
+    return record["rows"], record["polygons"], record["vertices"], record["seed"]
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_result(results, record):
+    # Run terakhir dengan konfigurasi yang sama, atau None
+    matches = [r for r in results if _config(r) == _config(record)]
+    return matches[-1] if matches else None
+
+
+def format_comparison(record, previous=None):
+    lines = [f"{record['rows']:,} baris ({record['polygons']} poligon x {record['vertices']} titik sudut)"]
+    for stage in [*record["seconds"], "total"]:
+        now = record["total"] if stage == "total" else record["seconds"][stage]
+        line = f"  {stage:<16} {now:>10.3f} s"
+        before = None
+        if previous is not None:
+            before = previous["total"] if stage == "total" else previous["seconds"].get(stage)
+        if before:
+            line += f"   sebelumnya {before:>10.3f} s ({(now - before) / before:+.0%})"
+        lines.append(line)
+    lines.append(f"  payload peta {record['map_payload_mb']} MB, puncak RSS {record['peak_rss_mb']} MB")
+    return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m asuransibanjir.bench",
+        description="Ukur waktu setiap tahap pipeline dengan portfolio dan layer bahaya sintetis.",
+    )
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"Jumlah baris portfolio, dipisah koma (default: {DEFAULT_SIZES})")
+    parser.add_argument("--polygons", type=int, default=300, help="Jumlah poligon bahaya")
+    parser.add_argument("--vertices", type=int, default=200, help="Jumlah titik sudut per poligon")
+    parser.add_argument("--seed", type=int, default=0, help="Seed data sintetis")
+    parser.add_argument("--results", default=DEFAULT_RESULTS,
+                        help=f"File JSON Lines untuk menyimpan hasil (default: {DEFAULT_RESULTS})")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results = load_results(args.results)
+    for size in args.sizes.split(","):
+        record = run_benchmark(parse_size(size), args.polygons, args.vertices, args.seed)
+        print(format_comparison(record, previous_result(results, record)))
+        with open(args.results, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        results.append(record)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import argparse
+import datetime
+import os
+import sys
+
+from . import export
+from .accumulation import DEFAULT_RADII, accumulate_exposure, top_hotspots
+from .hazard_cache import DEFAULT_CACHE_DIR
+from .pipeline import DATE_MODES, PipelineError, output_filename, run_pipeline
+from .pool import DEFAULT_WORKERS
+from .rates import load_rate_table
+from .simulation import DEFAULT_SEED, SIMULATION_MODES, ep_curve, simulate_losses, simulation_exposure
+from .streaming import run_pipeline_chunked
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m asuransibanjir",
+        description="Hitung Kategori Risiko, rate dan PML portfolio banjir tanpa membuka Streamlit.",
+    )
+    parser.add_argument("portfolio", help="File portfolio (.csv, .parquet, .feather atau .xlsx)")
+    parser.add_argument("hazard_zips", nargs="+", help="Satu atau lebih shapefile layer bahaya (.zip)")
+    parser.add_argument("-o", "--outdir", default=".", help="Folder output (default: folder saat ini)")
+    parser.add_argument("--expiry-after", type=_parse_date, default=None,
+                        help="Hanya pakai data dengan EXPIRY DATE > tanggal ini (YYYY-MM-DD)")
+    parser.add_argument("--date-mode", choices=DATE_MODES, default="strict",
+                        help="strict: DD/MM/YYYY saja; mixed: DD/MM/YYYY lalu MM/DD/YYYY")
+    parser.add_argument("--rate-table", default=None, help="File JSON tabel rate (default: rate_v1)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Folder cache layer bahaya hasil parsing (GeoParquet) dan gridcode per lokasi")
+    parser.add_argument("--no-cache", action="store_true", help="Selalu baca ulang shapefile dari zip dan join ulang semua lokasi")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Jumlah proses untuk membaca zip shapefile dan simulasi stokastik (--simulate-years)")
+    parser.add_argument("--no-xlsx", action="store_true", help="Jangan tulis file .xlsx")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="Tampilkan ukuran data (MB) setelah setiap tahap (tidak untuk --chunksize)")
+    parser.add_argument("--accumulation", action="store_true",
+                        help="Tulis akumulasi eksposur per lokasi dalam radius 200 m/500 m/1 km "
+                             "dan hotspot terbesar (tidak untuk --chunksize)")
+    parser.add_argument("--hotspots", type=int, default=10, help="Jumlah hotspot per radius (default: 10)")
+    parser.add_argument("--simulate-years", type=int, default=None,
+                        help="Simulasi stokastik N tahun kejadian banjir: tulis year loss table "
+                             "dan kurva EP (tidak untuk --chunksize)")
+    parser.add_argument("--simulate-by", choices=SIMULATION_MODES, default="location",
+                        help="Unit simulasi: location (polis di koordinat yang sama digabung) atau policy")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed simulasi (default: %(default)s)")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Proses portfolio per N baris (hemat memori)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    hazard_zips = []
+    for path in args.hazard_zips:
+        with open(path, "rb") as f:
+            hazard_zips.append((os.path.basename(path), f.read()))
+
+    rate_table = load_rate_table(args.rate_table) if args.rate_table else None
+
+    os.makedirs(args.outdir, exist_ok=True)
+    csv_path = os.path.join(args.outdir, output_filename(args.portfolio, "csv"))
+    xlsx_path = None if args.no_xlsx else os.path.join(args.outdir, output_filename(args.portfolio, "xlsx"))
+
+    try:
+        if args.chunksize:
+            result = run_pipeline_chunked(
+                args.portfolio,
+                hazard_zips,
+                csv_path,
+                expiry_after=args.expiry_after,
+                date_mode=args.date_mode,
+                rate_table=rate_table,
+                hazard_cache_dir=None if args.no_cache else args.cache_dir,
+                chunksize=args.chunksize,
+                xlsx_path=xlsx_path,
+                workers=args.workers,
+            )
+        else:
+            result = run_pipeline(
+                args.portfolio,
+                hazard_zips,
+                expiry_after=args.expiry_after,
+                date_mode=args.date_mode,
+                rate_table=rate_table,
+                hazard_cache_dir=None if args.no_cache else args.cache_dir,
+                workers=args.workers,
+                memory_report=args.memory_report,
+            )
+    except PipelineError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    for entry in getattr(result, "memory_report", None) or []:
+        print(f"memory: {entry['stage']:<8} {entry['rows']:>10,} baris {entry['mb']:>10,.1f} MB", file=sys.stderr)
+    if result.location_stats:
+        print(f"location store: {result.location_stats['hits']:,} lokasi dari cache, "
+              f"{result.location_stats['misses']:,} lokasi di-join", file=sys.stderr)
+    for name, kind, message in result.hazard_issues:
+        print(f"warning: {name}: {message}", file=sys.stderr)
+    if result.rate_report and result.rate_report["unrated"]:
+        print(f"warning: {result.rate_report['unrated']:,} baris tanpa rate "
+              f"(risiko tidak dikenal: {result.rate_report['unknown_risk']}, "
+              f"okupasi tidak dikenal: {result.rate_report['unknown_okupasi']})", file=sys.stderr)
+
+    if not args.chunksize:
+        # Mode streaming sudah menulis CSV per potongan
+        with open(csv_path, "w", encoding="utf-8", newline="") as f:
+            f.write(export.to_csv_text(result.final))
+    print(csv_path)
+
+    if xlsx_path:
+        if not args.chunksize:
+            export.write_xlsx(xlsx_path, result.final, result.summaries)
+        print(xlsx_path)
+
+    # Cube ikut ditulis agar bisa diolah ulang tanpa portfolio lengkap
+    tables = dict(result.summaries, cube=result.cube) if result.cube is not None else result.summaries
+    for path in export.write_summaries(tables, args.outdir):
+        print(path)
+
+    if args.chunksize and (args.accumulation or args.simulate_years):
+        print("warning: --accumulation dan --simulate-years butuh seluruh portfolio di memori, "
+              "dilewati untuk --chunksize", file=sys.stderr)
+        return 0
+
+    if args.accumulation:
+        accumulation = accumulate_exposure(result.final)
+        paths = [os.path.join(args.outdir, "akumulasi_lokasi.csv")]
+        accumulation.to_csv(paths[0], index=False, encoding='utf-8-sig')
+        for radius in DEFAULT_RADII:
+            paths.append(os.path.join(args.outdir, f"akumulasi_hotspot_{radius}m.csv"))
+            top_hotspots(accumulation, radius, args.hotspots).to_csv(paths[-1], index=False, encoding='utf-8-sig')
+        for path in paths:
+            print(path)
+
+    if args.simulate_years:
+        ylt = simulate_losses(simulation_exposure(result.final, args.simulate_by), args.simulate_years,
+                              args.seed, workers=args.workers)
+        for name, frame in (("simulasi_ylt", ylt), ("simulasi_ep", ep_curve(ylt))):
+            path = os.path.join(args.outdir, f"{name}.csv")
+            frame.to_csv(path, index=False, encoding='utf-8-sig')
+            print(path)
+    return 0
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+# Urutan format sama dengan parsing lama: DD/MM/YYYY dulu, lalu MM/DD/YYYY
+DAY_FIRST = '%d/%m/%Y'
+MONTH_FIRST = '%m/%d/%Y'
+MIXED_FORMATS = (DAY_FIRST, MONTH_FIRST)
+
+# Jumlah contoh nilai tidak valid yang disimpan di laporan
+MAX_EXAMPLES = 5
+
+
+def parse_dates(series, formats=MIXED_FORMATS):
+    """Parsing tanggal dengan beberapa format, hanya pada nilai unik.
+
+    Setiap format dicoba sekaligus untuk semua nilai unik yang belum berhasil,
+    lalu hasilnya dipetakan kembali ke setiap baris. Mengembalikan
+    ``(parsed, report)``: ``parsed`` bertipe datetime64 (NaT untuk kosong atau
+    tidak valid) dan ``report`` berisi jumlah baris per format, baris tidak
+    valid, serta baris ambigu (valid di lebih dari satu format dengan hasil
+    berbeda; format pertama yang dipakai).
+    """
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Index(uniques.astype(str))
+
+    parsed = pd.DatetimeIndex(np.full(len(uniques), np.datetime64("NaT"), dtype="datetime64[ns]"))
+    used_format = np.full(len(uniques), -1)
+    ambiguous = np.zeros(len(uniques), dtype=bool)
+    for i, fmt in enumerate(formats):
+        attempt = pd.to_datetime(uniques, format=fmt, errors='coerce')
+        ok = attempt.notna()
+        # Nilai yang sudah valid dengan format sebelumnya tapi juga valid (berbeda) di format ini
+        ambiguous |= (used_format >= 0) & ok & (attempt != parsed)
+        new = ok & (used_format < 0)
+        parsed = parsed.where(~new, attempt)
+        used_format[new] = i
+
+    valid_rows = codes >= 0
+    # Sentinel di akhir untuk kode -1 (kosong), juga aman bila semua baris kosong
+    row_format = np.append(used_format, -1)[codes]
+    invalid_rows = valid_rows & (row_format < 0)
+    invalid_uniques = uniques[used_format < 0]
+
+    result = pd.Series(
+        np.append(parsed.to_numpy(), np.datetime64("NaT", "ns"))[codes],
+        index=series.index, name=series.name,
+    )
+    report = {
+        "formats": {fmt: int((row_format == i).sum()) for i, fmt in enumerate(formats)},
+        "invalid": int(invalid_rows.sum()),
+        "ambiguous": int(np.append(ambiguous, False)[codes].sum()),
+        "missing": int((~valid_rows).sum()),
+        "invalid_examples": invalid_uniques[:MAX_EXAMPLES].tolist(),
+    }
+    return result, report
@@ -0,0 +1,20 @@
+# Format angka gaya Indonesia (titik sebagai pemisah ribuan) untuk tampilan.
+# Tabel ringkasan tetap numerik; format hanya dipasang saat ditampilkan.
+import pandas as pd
+
+
+def format_ribuan(series):
+    """Teks "1.234.567" untuk satu kolom numerik (NaN menjadi 0), sekali jalan per kolom."""
+    return series.fillna(0).round().astype("int64").map("{:,}".format).str.replace(",", ".", regex=False)
+
+
+def style_ribuan(df, columns=None):
+    """Styler untuk ``st.dataframe``: angka tampil dengan pemisah ribuan titik.
+
+    Nilai di balik tabel tetap numerik (pengurutan kolom tetap benar).
+    ``columns`` membatasi kolom yang diformat; default semua kolom numerik,
+    sehingga kolom seperti UY perlu dikecualikan lewat ``columns``.
+    """
+    if columns is None:
+        columns = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+    return df.style.format(thousands=".", decimal=",", precision=0, na_rep="", subset=columns)
@@ -0,0 +1,204 @@
+import io
+import os
+
+import pandas as pd
+import xlsxwriter
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Format unduhan hasil akhir: format -> (label, ekstensi, MIME)
+DOWNLOAD_FORMATS = {
+    "csv": ("CSV", "csv", "text/csv"),
+    "csv.gz": ("CSV (gzip)", "csv.gz", "application/gzip"),
+    "zip": ("CSV (zip)", "zip", "application/zip"),
+    "parquet": ("Parquet", "parquet", "application/vnd.apache.parquet"),
+    "xlsx": ("Excel (data + ringkasan)", "xlsx", XLSX_MIME),
+}
+# Level kompresi gzip/zip: jauh lebih cepat dari level 9 dengan ukuran hampir sama
+COMPRESS_LEVEL = 6
+
+# Batas baris per sheet Excel (termasuk baris header)
+EXCEL_MAX_ROWS = 1_048_576
+# Jumlah baris yang dikonversi ke objek Python sekaligus saat menulis sheet
+XLSX_BATCH_ROWS = 50_000
+# Kolom uang pada sheet data; di sheet ringkasan semua kolom angka diformat
+MONEY_COLS = ("TSI IDR", "PML")
+NUMBER_FORMAT = "#,##0"
+DATE_FORMAT = "dd/mm/yyyy"
+DATA_SHEET = "Data"
+
+
+def to_csv_text(final):
+    output = io.StringIO()
+    final.to_csv(output, index=False, encoding='utf-8-sig')
+    return output.getvalue()
+
+
+def _arrow_safe(final):
+    # Kolom object campuran (mis. EXPIRY DATE mode mixed: tanggal + teks tidak valid) ditulis sebagai teks
+    mixed = [
+        col for col in final.columns
+        if final[col].dtype == object and pd.api.types.infer_dtype(final[col], skipna=True).startswith("mixed")
+    ]
+    if not mixed:
+        return final
+    return final.assign(**{col: final[col].astype("string") for col in mixed})
+
+
+def export_bytes(final, fmt, summaries=None, archive_name="hasil.csv"):
+    """Serialisasi hasil akhir ke salah satu ``DOWNLOAD_FORMATS``.
+
+    CSV gzip/zip dikompresi langsung saat ditulis; ``archive_name`` adalah nama
+    file CSV di dalam zip. ``summaries`` hanya dipakai untuk format xlsx.
+    """
+    if fmt not in DOWNLOAD_FORMATS:
+        raise ValueError(f"fmt harus salah satu dari {tuple(DOWNLOAD_FORMATS)}")
+    if fmt == "xlsx":
+        return to_xlsx_bytes(final, summaries).getvalue()
+
+    output = io.BytesIO()
+    if fmt == "parquet":
+        _arrow_safe(final).to_parquet(output, index=False)
+    else:
+        compression = {
+            "csv": None,
+            "csv.gz": {"method": "gzip", "compresslevel": COMPRESS_LEVEL, "mtime": 0},
+            "zip": {"method": "zip", "archive_name": archive_name, "compresslevel": COMPRESS_LEVEL},
+        }[fmt]
+        final.to_csv(output, index=False, encoding='utf-8', compression=compression)
+    return output.getvalue()
+
+
+def summary_tables(summaries):
+    # (nama, tabel) untuk setiap tabel ringkasan; pivot dict dipecah per bagian
+    for name, table in summaries.items():
+        tables = table.items() if isinstance(table, dict) else [(None, table)]
+        for part, frame in tables:
+            yield (name if part is None else f"{name}_{part}"), frame
+
+
+def _has_index(frame):
+    return isinstance(frame.index, pd.MultiIndex) or frame.index.name is not None
+
+
+def write_summaries(summaries, outdir):
+    # Setiap tabel ringkasan ditulis sebagai CSV tersendiri
+    paths = []
+    for name, frame in summary_tables(summaries):
+        path = os.path.join(outdir, f"ringkasan_{name}.csv")
+        frame.to_csv(path, index=_has_index(frame), encoding='utf-8-sig')
+        paths.append(path)
+    return paths
+
+
+def _flat_table(frame):
+    # Pivot: index (UY) menjadi kolom biasa, header MultiIndex digabung "a / b"
+    if _has_index(frame):
+        frame = frame.reset_index()
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame = frame.copy()
+        frame.columns = [" / ".join(str(level) for level in col if level != "") for col in frame.columns]
+    return frame
+
+
+def _write_rows(worksheet, frame, first_row):
+    # Baris ditulis berurutan (wajib untuk constant_memory); NaN/NaT menjadi sel kosong
+    for start in range(0, len(frame), XLSX_BATCH_ROWS):
+        batch = frame.iloc[start:start + XLSX_BATCH_ROWS].astype(object)
+        batch = batch.where(batch.notna(), None)
+        for offset, values in enumerate(batch.itertuples(index=False, name=None)):
+            worksheet.write_row(first_row + start + offset, 0, values)
+
+
+class _SheetWriter:
+    # Menulis potongan DataFrame ke sheet bernama ``name``, "name 2", ... saat batas baris tercapai
+
+    def __init__(self, workbook, name, number_cols, max_rows):
+        self.workbook = workbook
+        self.name = name
+        self.number_cols = number_cols
+        self.max_rows = max_rows
+        self.number_format = workbook.add_format({"num_format": NUMBER_FORMAT})
+        self.worksheet = None
+        self.row = 0
+        self.sheets = 0
+
+    def _new_sheet(self, columns):
+        self.sheets += 1
+        name = self.name if self.sheets == 1 else f"{self.name} {self.sheets}"
+        self.worksheet = self.workbook.add_worksheet(name[:31])
+        for i, col in enumerate(columns):
+            # Format kolom dipakai oleh setiap sel tanpa format sendiri
+            fmt = self.number_format if col in self.number_cols else None
+            self.worksheet.set_column(i, i, max(10, min(len(str(col)) + 2, 40)), fmt)
+        self.worksheet.write_row(0, 0, [str(col) for col in columns])
+        self.row = 1
+
+    def write(self, frame):
+        start = 0
+        while start < len(frame) or self.worksheet is None:
+            if self.worksheet is None or self.row >= self.max_rows:
+                self._new_sheet(frame.columns)
+            part = frame.iloc[start:start + self.max_rows - self.row]
+            _write_rows(self.worksheet, part, self.row)
+            self.row += len(part)
+            start += len(part)
+
+
+class XlsxExport:
+    """Workbook Excel yang ditulis bertahap: potongan data dulu, ringkasan di akhir.
+
+    xlsxwriter berjalan dengan ``constant_memory`` dan baris ditulis per batch,
+    jadi memori tetap datar berapa pun jumlah barisnya. Angka tetap numerik
+    dengan format ribuan bawaan Excel; data lebih dari ``max_rows`` baris
+    dipecah ke sheet "Data 2", "Data 3", dst.
+    """
+
+    def __init__(self, target, max_rows=EXCEL_MAX_ROWS):
+        self.workbook = xlsxwriter.Workbook(target, {
+            "constant_memory": True,
+            "default_date_format": DATE_FORMAT,
+            "strings_to_numbers": False,
+            "strings_to_urls": False,
+        })
+        self.max_rows = max_rows
+        self.data = _SheetWriter(self.workbook, DATA_SHEET, MONEY_COLS, max_rows)
+
+    def write_data(self, frame):
+        self.data.write(frame)
+
+    def write_summaries(self, summaries):
+        for name, frame in summary_tables(summaries):
+            keys = list(frame.index.names) if _has_index(frame) else [frame.columns[0]]
+            frame = _flat_table(frame)
+            number_cols = [
+                col for col in frame.columns
+                if col not in keys and pd.api.types.is_numeric_dtype(frame[col])
+            ]
+            _SheetWriter(self.workbook, name, number_cols, self.max_rows).write(frame)
+
+    def close(self):
+        if self.data.worksheet is None:
+            self.data.write(pd.DataFrame())
+        self.workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_xlsx(target, final, summaries=None, max_rows=EXCEL_MAX_ROWS):
+    # Hasil akhir di sheet "Data" (dipecah bila perlu) dan satu sheet per tabel ringkasan
+    with XlsxExport(target, max_rows) as workbook:
+        workbook.write_data(final)
+        workbook.write_summaries(summaries or {})
+
+
+def to_xlsx_bytes(final, summaries=None):
+    output_excel = io.BytesIO()
+    write_xlsx(output_excel, final, summaries)
+    # Kembalikan posisi ke awal agar bisa dibaca
+    output_excel.seek(0)
+    return output_excel
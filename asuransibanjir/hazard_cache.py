@@ -0,0 +1,211 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from .spatial import LAYER_KEY_ATTR, read_hazard_zip
+
+# Naikkan versi ini jika format artefak cache berubah agar cache lama diabaikan
+CACHE_FORMAT = "v1"
+DEFAULT_CACHE_DIR = os.environ.get(
+    "ASURANSIBANJIR_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "asuransibanjir", "hazard"),
+)
+
+
+# Layer yang sudah dimuat di proses ini, supaya tidak dibaca ulang dari zip atau GeoParquet
+MEMORY_CACHE_SIZE = 8
+_loaded_layers = OrderedDict()
+
+# Presisi koordinat untuk key LocationStore (6 desimal ~ 0,1 meter)
+COORD_DECIMALS = 6
+# Key int64 per koordinat: (lon + 180) * 1e6 di bit atas, (lat + 90) * 1e6 di 28 bit bawah
+_LAT_SPAN = 1 << 28
+
+
+def zip_digest(zip_bytes):
+    return hashlib.sha256(zip_bytes).hexdigest()
+
+
+def _cache_paths(digest, cache_dir):
+    base = os.path.join(cache_dir, f"{CACHE_FORMAT}-{digest}")
+    return base + ".parquet", base + ".missing"
+
+
+def _write_atomic(frame, path):
+    # Tulis ke file sementara lalu rename, supaya proses lain tidak membaca file setengah jadi
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        if isinstance(frame, gpd.GeoDataFrame):
+            frame.to_parquet(tmp_path, index=False, write_covering_bbox=True)
+        else:
+            frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_hazard_zip(zip_bytes, cache_dir=DEFAULT_CACHE_DIR):
+    """Baca zip shapefile melalui cache GeoParquet di disk.
+
+    Kunci cache adalah SHA-256 isi zip, sehingga layer yang sama hanya
+    di-parse sekali walaupun portfolio atau proses server berganti.
+    Mengembalikan None jika zip tidak berisi .shp, sama seperti
+    ``read_hazard_zip``.
+    """
+    if cache_dir is None:
+        return read_hazard_zip(zip_bytes)
+
+    digest = zip_digest(zip_bytes)
+    if (digest, cache_dir) in _loaded_layers:
+        _loaded_layers.move_to_end((digest, cache_dir))
+        return _loaded_layers[(digest, cache_dir)]
+
+    gdf_shape = _load_from_disk(zip_bytes, digest, cache_dir)
+    if gdf_shape is not None:
+        # Identitas layer untuk LocationStore (lihat spatial.join_layers)
+        gdf_shape.attrs[LAYER_KEY_ATTR] = digest
+        _loaded_layers[(digest, cache_dir)] = gdf_shape
+        while len(_loaded_layers) > MEMORY_CACHE_SIZE:
+            _loaded_layers.popitem(last=False)
+    return gdf_shape
+
+
+def _load_from_disk(zip_bytes, digest, cache_dir):
+    parquet_path, missing_path = _cache_paths(digest, cache_dir)
+    if os.path.exists(parquet_path):
+        try:
+            return gpd.read_parquet(parquet_path)
+        except Exception:
+            # Artefak rusak: parse ulang dari zip dan timpa
+            os.remove(parquet_path)
+    if os.path.exists(missing_path):
+        return None
+
+    gdf_shape = read_hazard_zip(zip_bytes)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if gdf_shape is None:
+            open(missing_path, "w").close()
+        else:
+            _write_atomic(gdf_shape, parquet_path)
+    except OSError:
+        # Cache hanya optimasi; folder yang tidak bisa ditulis tidak boleh menggagalkan proses
+        pass
+    return gdf_shape
+
+
+def clear_hazard_cache(cache_dir=DEFAULT_CACHE_DIR):
+    _loaded_layers.clear()
+    removed = 0
+    if not os.path.isdir(cache_dir):
+        return removed
+    for name in os.listdir(cache_dir):
+        if name.endswith((".parquet", ".missing")):
+            os.remove(os.path.join(cache_dir, name))
+            removed += 1
+    return removed
+
+
+class LocationStore:
+    """Gridcode per (koordinat dibulatkan, layer) yang disimpan di disk antar run.
+
+    Satu file Parquet per layer (SHA-256 isi zip) berisi key koordinat dan
+    gridcode; gridcode kosong berarti lokasi sudah dicek dan tidak mengenai
+    poligon. Portfolio bulan berikutnya hanya perlu di-join untuk koordinat
+    yang belum ada. Hasil join baru disimpan di memori oleh ``update`` dan
+    ditulis sekali oleh ``flush`` di akhir run. ``stats`` menghitung lokasi
+    yang seluruhnya diambil dari store (``hits``) dan yang di-join (``misses``).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.stats = {"hits": 0, "misses": 0}
+        self._tables = {}
+        self._dirty = set()
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, f"{CACHE_FORMAT}-{digest}.locations.parquet")
+
+    @staticmethod
+    def location_keys(lon, lat):
+        """Key int64 per koordinat; -1 untuk koordinat kosong atau di luar [-180, 180] x [-90, 90].
+
+        Lokasi dengan key -1 tidak pernah diambil dari atau disimpan ke store.
+        """
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        valid = (lon >= -180) & (lon <= 180) & (lat >= -90) & (lat <= 90)
+        scale = 10 ** COORD_DECIMALS
+        lon_key = np.round((np.where(valid, lon, 0) + 180) * scale).astype(np.int64)
+        lat_key = np.round((np.where(valid, lat, 0) + 90) * scale).astype(np.int64)
+        return np.where(valid, lon_key * _LAT_SPAN + lat_key, -1)
+
+    def _load(self, digest):
+        # (key terurut, gridcode) untuk layer ini; dibaca dari disk sekali per store
+        if digest not in self._tables:
+            keys, codes = np.empty(0, dtype=np.int64), np.empty(0)
+            path = self._path(digest)
+            if os.path.exists(path):
+                try:
+                    table = pd.read_parquet(path)
+                    keys, codes = table["key"].to_numpy(), table["gridcode"].to_numpy()
+                except Exception:
+                    # Artefak rusak: anggap kosong, akan ditimpa saat flush
+                    pass
+            self._tables[digest] = keys, codes
+        return self._tables[digest]
+
+    def lookup(self, digest, keys):
+        """``(known, codes)``: mask key yang sudah ada di store dan gridcode-nya (NaN jika tidak kena)."""
+        stored, stored_codes = self._load(digest)
+        if not len(stored):
+            return np.zeros(len(keys), dtype=bool), np.full(len(keys), np.nan)
+        pos = np.minimum(np.searchsorted(stored, keys), len(stored) - 1)
+        known = (stored[pos] == keys) & (keys >= 0)
+        return known, np.where(known, stored_codes[pos], np.nan)
+
+    def update(self, digest, keys, codes):
+        # Gabungkan hasil join baru ke tabel di memori; file baru ditulis oleh flush
+        keys, codes = np.asarray(keys), np.asarray(codes)
+        keep = keys >= 0
+        keys, codes = keys[keep], codes[keep]
+        if not len(keys):
+            return
+        # Beberapa lokasi bisa jatuh ke key yang sama setelah dibulatkan: ambil yang terakhir
+        order = np.argsort(keys, kind="stable")
+        keys, codes = keys[order], codes[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        keys, codes = keys[last], codes[last]
+
+        stored, stored_codes = self._load(digest)
+        if len(stored):
+            pos = np.minimum(np.searchsorted(stored, keys), len(stored) - 1)
+            present = stored[pos] == keys
+            stored_codes = stored_codes.copy()
+            stored_codes[pos[present]] = codes[present]
+            keys, codes = keys[~present], codes[~present]
+            insert_at = np.searchsorted(stored, keys)
+            keys = np.insert(stored, insert_at, keys)
+            codes = np.insert(stored_codes, insert_at, codes)
+        self._tables[digest] = keys, codes
+        self._dirty.add(digest)
+
+    def flush(self):
+        # Tulis tabel yang berubah (atomic), sekali per layer
+        for digest in sorted(self._dirty):
+            keys, codes = self._tables[digest]
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                _write_atomic(pd.DataFrame({"key": keys, "gridcode": codes}), self._path(digest))
+            except OSError:
+                # Sama seperti cache layer: gagal menulis tidak boleh menggagalkan proses
+                pass
+        self._dirty.clear()
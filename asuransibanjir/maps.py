@@ -0,0 +1,286 @@
+import numpy as np
+import pandas as pd
+import pydeck as pdk
+
+from .display import format_ribuan
+
+LON_COL = "Longitude"
+LAT_COL = "Latitude"
+RISK_COL = "Kategori Risiko"
+TSI_COL = "TSI IDR"
+PML_COL = "PML"
+
+# Mapping risiko ke bobot untuk heatmap
+RISK_WEIGHTS = {
+    "Rendah": 0.3,
+    "Sedang": 0.6,
+    "Tinggi": 1.0,
+    "No Risk": 0.1
+}
+
+# Mapping warna untuk scatterplot
+RISK_COLORS = {
+    "Rendah": [0, 255, 0, 180],     # Hijau transparan
+    "Sedang": [255, 255, 0, 180],   # Kuning transparan
+    "Tinggi": [255, 0, 0, 180],     # Merah transparan
+    "No Risk": [160, 160, 160, 180] # Abu-abu transparan
+}
+UNKNOWN_COLOR = [0, 0, 0, 180]
+
+EXCLUDED_POPUP_COLS = ['SISTEM', 'NAMA FILE', 'Unique', 'TOC', 'gridcode', 'weight', 'color', 'Jumlah Lantai_Rev', 'Jumlah_Lantai_Fix']
+
+# Kolom default yang ditampilkan di tooltip peta
+TOOLTIP_FIELDS = [
+    'Kategori Risiko', 'Kategori Okupasi', 'Kode Okupasi_mod', 'Jumlah Lantai',
+    'UY', 'TSI IDR', 'PML', 'EXPIRY DATE',
+]
+
+TOOLTIP_STYLE = {
+    "backgroundColor": "white",
+    "color": "black",
+    "fontSize": "12px",
+    "lineHeight": "1",
+    "maxWidth": "200px",
+    "padding": "5px",
+}
+
+# "auto": titik individu hanya jika jumlahnya kecil atau zoom sudah dekat, selain itu grid.
+# Titik yang dikirim ke browser tidak pernah lebih dari MAX_MAP_POINTS
+MAP_MODES = ("auto", "points", "grid")
+MAX_MAP_POINTS = 50_000
+POINT_ZOOM = 12
+# Ukuran peta di halaman (piksel; lebar maksimum karena use_container_width) untuk area yang terlihat
+VIEW_WIDTH_PX = 1600
+VIEW_HEIGHT_PX = 750
+DEFAULT_ZOOM = 5
+# Lebar sel grid (piksel layar) pada level zoom yang dipilih
+CELL_PIXELS = 40
+# Presisi koordinat yang dikirim ke browser (5 desimal ~ 1 meter)
+COORD_DECIMALS = 5
+# Lebar sel (derajat, ~11 km) untuk mencari area terpadat sebagai pusat default peta
+CENTER_CELL_DEG = 0.1
+# Pusat peta jika tidak ada koordinat valid: tengah Indonesia (Longitude, Latitude)
+DEFAULT_CENTER = (118.0, -2.5)
+
+# Pilihan pusat peta di halaman; "Area terpadat" memakai view_center
+CENTER_MODES = ("Area terpadat", "Kota", "Hotspot akumulasi", "Koordinat")
+# Pilihan pusat peta per kota (Longitude, Latitude)
+CITY_CENTERS = {
+    "Jakarta": (106.8456, -6.2088),
+    "Surabaya": (112.7521, -7.2575),
+    "Bandung": (107.6191, -6.9175),
+    "Semarang": (110.4203, -6.9667),
+    "Yogyakarta": (110.3695, -7.7956),
+    "Medan": (98.6722, 3.5952),
+    "Palembang": (104.7458, -2.9761),
+    "Makassar": (119.4327, -5.1477),
+    "Balikpapan": (116.8312, -1.2379),
+    "Denpasar": (115.2126, -8.6705),
+}
+
+
+def tooltip_fields(final, fields=None):
+    # Kolom tooltip (default TOOLTIP_FIELDS) yang memang ada di final
+    fields = TOOLTIP_FIELDS if fields is None else fields
+    return [col for col in fields if col in final.columns and col not in EXCLUDED_POPUP_COLS]
+
+
+def _tooltip_key(i):
+    # Nama kolom asli bisa berisi spasi, jadi tooltip memakai key pendek
+    return f"tt{i}"
+
+
+def _tooltip_text(series):
+    return series.astype(object).where(series.notna(), "-").astype(str)
+
+
+def _risk_labels(final):
+    if RISK_COL in final.columns:
+        return final[RISK_COL]
+    return pd.Series(np.nan, index=final.index)
+
+
+def cell_size_deg(zoom):
+    # Lebar sel dalam derajat agar sekitar CELL_PIXELS piksel pada level zoom tersebut
+    return CELL_PIXELS * 360 / (256 * 2 ** zoom)
+
+
+def view_center(final, cell_deg=CENTER_CELL_DEG):
+    """Pusat default peta: rata-rata koordinat polis di sel grid terpadat.
+
+    Rata-rata seluruh portfolio bisa jatuh di antara kota (mis. portfolio
+    Jakarta + Surabaya), sehingga area awal peta tidak berisi satu titik pun.
+    """
+    lon = final[LON_COL].to_numpy(dtype=float)
+    lat = final[LAT_COL].to_numpy(dtype=float)
+    valid = ~(np.isnan(lon) | np.isnan(lat))
+    if not valid.any():
+        return DEFAULT_CENTER
+    lon, lat = lon[valid], lat[valid]
+    cells = pd.DataFrame({"ix": np.floor(lon / cell_deg), "iy": np.floor(lat / cell_deg)})
+    cell_id = cells.groupby(["ix", "iy"], sort=False).ngroup().to_numpy()
+    densest = cell_id == np.bincount(cell_id).argmax()
+    return float(lon[densest].mean()), float(lat[densest].mean())
+
+
+def view_bounds(center, zoom, width=VIEW_WIDTH_PX, height=VIEW_HEIGHT_PX):
+    # (min_lon, min_lat, max_lon, max_lat) yang terlihat pada view awal peta di sekitar ``center``
+    lon, lat = center
+    deg_per_px = 360 / (256 * 2 ** zoom)
+    half_w = width / 2 * deg_per_px
+    half_h = height / 2 * deg_per_px * np.cos(np.radians(lat))
+    return lon - half_w, lat - half_h, lon + half_w, lat + half_h
+
+
+def in_view(final, center, zoom):
+    min_lon, min_lat, max_lon, max_lat = view_bounds(center, zoom)
+    lon = final[LON_COL].to_numpy(dtype=float)
+    lat = final[LAT_COL].to_numpy(dtype=float)
+    return (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+
+
+def resolve_mode(final, mode="auto", zoom=DEFAULT_ZOOM, center=None):
+    """Mode peta yang dipakai: "points" atau "grid".
+
+    Portfolio kecil selalu ditampilkan per titik. Untuk portfolio besar, mode
+    "auto" dan "points" hanya memakai titik mulai ``POINT_ZOOM`` dan hanya jika
+    titik di area yang terlihat (lihat ``view_bounds``) tidak lebih dari
+    ``MAX_MAP_POINTS``; selain itu kembali ke grid.
+    """
+    if mode not in MAP_MODES:
+        raise ValueError(f"mode harus salah satu dari {MAP_MODES}")
+    if mode == "grid":
+        return mode
+    if len(final) <= MAX_MAP_POINTS:
+        return "points"
+    if zoom >= POINT_ZOOM:
+        center = view_center(final) if center is None else center
+        if in_view(final, center, zoom).sum() <= MAX_MAP_POINTS:
+            return "points"
+    return "grid"
+
+
+def build_map_data(final, fields=None):
+    """Data titik yang ringkas: koordinat dibulatkan, bobot, risiko dan kolom tooltip.
+
+    Warna tidak dikirim per baris; setiap kategori risiko menjadi layer sendiri.
+    """
+    data = pd.DataFrame({
+        "x": final[LON_COL].round(COORD_DECIMALS),
+        "y": final[LAT_COL].round(COORD_DECIMALS),
+        "w": _risk_labels(final).map(RISK_WEIGHTS).astype(float).fillna(0.1) if RISK_COL in final.columns else 1,
+        "risk": _risk_labels(final),
+    }).dropna(subset=["x", "y"])
+
+    # Isi tooltip: satu kolom teks per field, dibentuk sekaligus per kolom (bukan HTML per baris)
+    for i, col in enumerate(tooltip_fields(final, fields)):
+        data[_tooltip_key(i)] = _tooltip_text(final.loc[data.index, col])
+    return data
+
+
+def aggregate_grid(final, cell_deg):
+    """Agregasi titik ke sel grid persegi berukuran ``cell_deg`` derajat.
+
+    Per sel: jumlah polis, total TSI, total PML dan kategori risiko dominan
+    (kategori dengan jumlah polis terbanyak).
+    """
+    points = pd.DataFrame({
+        "ix": np.floor(final[LON_COL] / cell_deg),
+        "iy": np.floor(final[LAT_COL] / cell_deg),
+        "tsi": final[TSI_COL] if TSI_COL in final.columns else 0,
+        "pml": final[PML_COL] if PML_COL in final.columns else 0,
+        "risk": _risk_labels(final).astype(object),
+    }).dropna(subset=["ix", "iy"])
+
+    cells = points.groupby(["ix", "iy"]).agg(
+        count=("tsi", "size"), tsi=("tsi", "sum"), pml=("pml", "sum")
+    )
+    dominant = (
+        points.groupby(["ix", "iy", "risk"]).size().rename("n").reset_index()
+        .sort_values("n", ascending=False, kind="stable")
+        .drop_duplicates(["ix", "iy"])
+        .set_index(["ix", "iy"])["risk"]
+    )
+    cells["risk"] = dominant.reindex(cells.index)
+    cells = cells.reset_index()
+    cells["x"] = ((cells["ix"] + 0.5) * cell_deg).round(COORD_DECIMALS)
+    cells["y"] = ((cells["iy"] + 0.5) * cell_deg).round(COORD_DECIMALS)
+    cells["w"] = cells["count"] * cells["risk"].map(RISK_WEIGHTS).fillna(0.1)
+    return cells.drop(columns=["ix", "iy"])
+
+
+def _layers_by_risk(data, radius, pickable=True, **kwargs):
+    # Satu ScatterplotLayer per kategori risiko dengan warna konstan
+    layers = []
+    groups = [(risk, data[data["risk"] == risk]) for risk in RISK_COLORS]
+    groups.append((None, data[~data["risk"].isin(list(RISK_COLORS))]))
+    for risk, subset in groups:
+        if subset.empty:
+            continue
+        layers.append(pdk.Layer(
+            "ScatterplotLayer",
+            data=subset.drop(columns="risk").to_dict(orient="records"),
+            get_position="[x, y]",
+            get_fill_color=RISK_COLORS.get(risk, UNKNOWN_COLOR),
+            get_radius=radius,
+            pickable=pickable,
+            auto_highlight=True,
+            **kwargs,
+        ))
+    return layers
+
+
+def build_deck(final, fields=None, mode="auto", zoom=DEFAULT_ZOOM, center=None):
+    """Peta heatmap + scatterplot portfolio dengan view awal di ``center`` (default ``view_center``).
+
+    Mode "points" mengirim setiap polis dengan tooltip berisi ``fields``
+    (default TOOLTIP_FIELDS); untuk portfolio besar hanya polis di area yang
+    terlihat. Mode "grid" mengirim agregat per sel grid yang ukurannya
+    mengikuti ``zoom``. Lihat ``resolve_mode`` untuk kapan titik dipakai.
+    """
+    center = view_center(final) if center is None else center
+    mode = resolve_mode(final, mode, zoom, center)
+    if mode == "grid":
+        cell_deg = cell_size_deg(zoom)
+        data = aggregate_grid(final, cell_deg)
+        data["tsi_text"] = format_ribuan(data["tsi"])
+        data["pml_text"] = format_ribuan(data["pml"])
+        data["risk_text"] = _tooltip_text(data["risk"])
+        # Radius dalam meter: setengah lebar sel (1 derajat ~ 111 km)
+        scatter_layers = _layers_by_risk(data, radius=cell_deg * 111_000 / 2, radius_min_pixels=2)
+        tooltip_html = (
+            "<b>Jumlah Polis</b>: {count}<br><b>TSI</b>: {tsi_text}<br>"
+            "<b>PML</b>: {pml_text}<br><b>Risiko dominan</b>: {risk_text}"
+        )
+    else:
+        points = final if len(final) <= MAX_MAP_POINTS else final[in_view(final, center, zoom)]
+        data = build_map_data(points, fields)
+        scatter_layers = _layers_by_risk(data, radius=10)
+        tooltip_html = "<br>".join(
+            f"<b>{col}</b>: {{{_tooltip_key(i)}}}" for i, col in enumerate(tooltip_fields(final, fields))
+        )
+
+    # Heatmap Layer
+    heatmap_layer = pdk.Layer(
+        "HeatmapLayer",
+        data=data[["x", "y", "w"]].to_dict(orient="records"),
+        get_position="[x, y]",
+        get_weight="w",
+        aggregation="MEAN" if mode == "points" else "SUM",
+        radiusPixels=25,
+    )
+
+    # View state untuk map
+    view_state = pdk.ViewState(
+        latitude=center[1],
+        longitude=center[0],
+        zoom=zoom,
+        pitch=0,
+    )
+
+    return pdk.Deck(
+        layers=[heatmap_layer] + scatter_layers,
+        initial_view_state=view_state,
+        tooltip={"html": tooltip_html, "style": TOOLTIP_STYLE},
+        map_style="mapbox://styles/mapbox/dark-v10"
+    )
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+# Kolom teks dengan jumlah nilai unik paling banyak rasio ini dari jumlah baris menjadi category
+CATEGORY_MAX_RATIO = 0.5
+ARROW_STRING = "string[pyarrow]"
+
+
+def _downcast_float(series):
+    # Hanya jika semua nilai tetap sama persis di float32 (mis. gridcode, jumlah lantai)
+    downcast = series.astype(np.float32)
+    if np.array_equal(downcast.to_numpy(dtype=series.dtype), series.to_numpy(), equal_nan=True):
+        return downcast
+    return series
+
+
+def compact_dtypes(df, keep=()):
+    """Ubah tipe kolom ``df`` (in place) agar hemat memori, lalu kembalikan ``df``.
+
+    Kolom teks berkardinalitas rendah menjadi category, kolom teks lain menjadi
+    string Arrow, integer di-downcast dan float menjadi float32 hanya jika
+    nilainya tidak berubah. Kolom di ``keep`` dan kolom campuran (mis. EXPIRY
+    DATE berisi tanggal dan teks) dibiarkan.
+    """
+    for col in df.columns:
+        series = df[col]
+        if col in keep:
+            continue
+        if series.dtype == object:
+            if pd.api.types.infer_dtype(series, skipna=True) != "string":
+                continue
+            if series.nunique() <= CATEGORY_MAX_RATIO * len(series):
+                df[col] = series.astype("category")
+            else:
+                df[col] = series.astype(ARROW_STRING)
+        elif pd.api.types.is_integer_dtype(series) and isinstance(series.dtype, np.dtype):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series) and series.dtype == np.float64:
+            df[col] = _downcast_float(series)
+    return df
+
+
+def frame_memory(df):
+    """Memori DataFrame dalam byte, termasuk isi string/objek."""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def memory_entry(stage, df):
+    # Satu baris laporan memori per tahap pipeline
+    return {"stage": stage, "rows": len(df), "columns": df.shape[1], "mb": round(frame_memory(df) / 1e6, 1)}
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+# Pola angka setelah karakter selain digit, titik, koma dan minus dibuang (mis. "Rp", spasi)
+PLAIN = r"-?\d+"
+# Hanya pemisah ribuan, satu jenis: "1.250.000" atau "712,520,488"
+THOUSANDS = r"-?\d{1,3}([.,])\d{3}(?:\1\d{3})*"
+# Format Indonesia dengan desimal koma: "1.250.000,00" atau "1250,5"
+DECIMAL_COMMA = r"-?(?:\d{1,3}(?:\.\d{3})+|\d+),\d+"
+# Format dengan desimal titik: "1,250,000.50" atau "1250.75"
+DECIMAL_POINT = r"-?(?:\d{1,3}(?:,\d{3})+|\d+)\.\d+"
+
+
+def _parse_unique(values):
+    # values: Series string unik; mengembalikan Series numerik dengan index yang sama
+    text = values.str.replace(r"[^\d.,-]", "", regex=True)
+    result = pd.Series(np.nan, index=values.index, dtype=object)
+
+    whole = text.str.fullmatch(PLAIN) | text.str.fullmatch(THOUSANDS)
+    result[whole] = text[whole].str.replace(r"[.,]", "", regex=True)
+
+    comma = ~whole & text.str.fullmatch(DECIMAL_COMMA)
+    result[comma] = text[comma].str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+
+    point = ~whole & ~comma & text.str.fullmatch(DECIMAL_POINT)
+    result[point] = text[point].str.replace(",", "", regex=False)
+
+    # Nilai yang tidak cocok pola mana pun: aturan lama, semua selain digit dibuang
+    malformed = ~(whole | comma | point)
+    result[malformed] = values[malformed].str.replace(r"[^\d]", "", regex=True)
+
+    return pd.to_numeric(result, errors='coerce')
+
+
+def parse_money(series):
+    """Konversi kolom nilai uang (TSI, premi, limit, ...) menjadi angka.
+
+    Kolom yang sudah numerik dikembalikan apa adanya. Kolom teks diproses
+    hanya pada nilai unik dan mengenali pemisah ribuan titik/koma serta
+    desimal gaya Indonesia ("1.250.000,00") maupun gaya titik ("1,250,000.50").
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+
+    codes, uniques = pd.factorize(series)
+    values = _parse_unique(pd.Series(uniques, dtype=object).astype(str)).to_numpy()
+    if (codes < 0).any():
+        # Baris kosong (kode -1) menjadi NaN
+        values = np.append(values.astype(float), np.nan)
+    return pd.Series(values[codes], index=series.index, name=series.name)
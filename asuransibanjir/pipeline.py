@@ -0,0 +1,442 @@
+import datetime
+import functools
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.offsets import MonthEnd
+
+from .hazard_cache import DEFAULT_CACHE_DIR, LocationStore, load_hazard_zip
+from .memory import compact_dtypes, memory_entry
+from .money import parse_money
+from .pool import DEFAULT_WORKERS
+from .rates import load_rate_table, apply_rate_table
+from .spatial import LON_COL, LAT_COL, layer_grid_cols, spatial_join_zips
+from . import dates, summaries
+
+TSI_COL = "TSI IDR"
+RATE_COL = "Scaling"
+BUILDING_COL = "Kategori Okupasi"
+FLOOR_COL = "Jumlah Lantai"
+KODE_OKUPASI_COL = "Kode Okupasi_mod"
+KODE_OKUPASI_2_COL = "Kode Okupasi (2 digit awal)"
+RISK_COL = "Kategori Risiko"
+PML_COL = "PML"
+# Kolom yang tidak di-downcast: koordinat butuh presisi penuh, nilai uang dijumlahkan
+FULL_PRECISION_COLS = (LAT_COL, LON_COL, TSI_COL, PML_COL)
+
+RISK_LABELS = {1: 'Rendah', 2: 'Sedang', 3: 'Tinggi'}
+NO_RISK = "No Risk"
+
+# Status koordinat per baris; selain OK, baris masuk ke unduhan "baris tidak valid"
+COORD_STATUS_COL = "Status Koordinat"
+COORD_OK, COORD_MISSING, COORD_ZERO, COORD_SWAPPED, COORD_OUTSIDE = range(5)
+COORD_STATUS = {
+    COORD_OK: "OK",
+    COORD_MISSING: "Kosong/tidak valid",
+    COORD_ZERO: "Bernilai nol",
+    COORD_SWAPPED: "Latitude/Longitude tertukar",
+    COORD_OUTSIDE: "Di luar Indonesia",
+}
+# Batas kasar wilayah Indonesia (min_lon, min_lat, max_lon, max_lat)
+INDONESIA_BOUNDS = (94.0, -11.5, 141.5, 6.5)
+
+# Skema kolom portfolio yang dikenal. Kolom yang sudah bertipe sesuai skema
+# (mis. dari Parquet/Feather/XLSX) dipakai langsung tanpa dibersihkan dari string.
+PORTFOLIO_SCHEMA = {
+    'INCEPTION DATE': 'datetime',
+    'EXPIRY DATE': 'datetime',
+    LAT_COL: 'numeric',
+    LON_COL: 'numeric',
+    TSI_COL: 'numeric',
+    FLOOR_COL: 'numeric',
+    'UY': 'numeric',
+    BUILDING_COL: 'text',
+    KODE_OKUPASI_COL: 'text',
+}
+PORTFOLIO_FORMATS = ("csv", "parquet", "feather", "xlsx")
+
+# Mode parsing tanggal: "strict" (DD/MM/YYYY, baris tanpa EXPIRY DATE dibuang)
+# atau "mixed" (DD/MM/YYYY lalu MM/DD/YYYY, baris tidak valid tetap disimpan)
+DATE_MODES = ("strict", "mixed")
+
+
+class PipelineError(ValueError):
+    pass
+
+
+@dataclass
+class PipelineResult:
+    final: pd.DataFrame
+    grid_col: str = None
+    as_of_date: datetime.date = None
+    invalid_coordinates: pd.DataFrame = None
+    invalid_expiry: pd.DataFrame = None
+    date_report: dict = None
+    hazard_issues: list = field(default_factory=list)
+    rate_report: dict = None
+    summaries: dict = field(default_factory=dict)
+    cube: pd.DataFrame = None
+    memory_report: list = None
+    location_stats: dict = None
+
+
+def portfolio_format(file):
+    # Format ditentukan dari ekstensi nama file (path atau UploadedFile Streamlit)
+    name = getattr(file, "name", file)
+    ext = os.path.splitext(str(name))[1].lower().lstrip(".")
+    if ext in ("pq", "parquet"):
+        return "parquet"
+    if ext in ("feather", "arrow"):
+        return "feather"
+    if ext in ("xlsx", "xls"):
+        return "xlsx"
+    return "csv"
+
+
+def _excel_engine():
+    # calamine (Rust) jauh lebih cepat dari openpyxl; openpyxl dipakai jika tidak terpasang
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return "openpyxl"
+    return "calamine"
+
+
+def apply_schema(df):
+    """Samakan tipe kolom yang dikenal dengan ``PORTFOLIO_SCHEMA``.
+
+    Kolom tanggal berisi objek date/datetime menjadi datetime64, kolom angka
+    bertipe object yang semua isinya angka (mis. dari Excel) menjadi numerik,
+    dan kolom teks bernilai angka (mis. Kode Okupasi dari Excel) menjadi
+    string. Kolom yang masih berupa teks mentah dibiarkan untuk dibersihkan
+    tahap berikutnya (parser koordinat, uang dan jumlah lantai).
+    """
+    for col, kind in PORTFOLIO_SCHEMA.items():
+        if col not in df.columns:
+            continue
+        series = df[col]
+        if kind == 'datetime' and not pd.api.types.is_datetime64_any_dtype(series):
+            if pd.api.types.infer_dtype(series, skipna=True) in ('date', 'datetime', 'datetime64'):
+                df[col] = pd.to_datetime(series)
+        elif kind == 'numeric' and series.dtype == object:
+            if pd.api.types.infer_dtype(series, skipna=True) in ('integer', 'floating', 'mixed-integer-float', 'decimal'):
+                df[col] = pd.to_numeric(series)
+        elif kind == 'text' and pd.api.types.is_numeric_dtype(series):
+            df[col] = series.astype(str).where(series.notna())
+    return df
+
+
+def load_portfolio(file, fmt=None):
+    """Baca portfolio CSV, Parquet, Feather atau XLSX menjadi DataFrame.
+
+    CSV dan Parquet/Feather dibaca dengan pyarrow (multi-thread).
+    """
+    fmt = fmt or portfolio_format(file)
+    if fmt == "parquet":
+        df = pd.read_parquet(file)
+    elif fmt == "feather":
+        df = pd.read_feather(file)
+    elif fmt == "xlsx":
+        df = pd.read_excel(file, engine=_excel_engine())
+    else:
+        df = pd.read_csv(file, engine="pyarrow")
+    df.columns = df.columns.str.strip()  # Bersihkan spasi pada nama kolom
+    return apply_schema(df)
+
+
+def parse_inception_date(df, date_mode="strict"):
+    # Tanggal "as of" adalah akhir bulan dari INCEPTION DATE terbaru
+    if 'INCEPTION DATE' not in df.columns:
+        return df, None
+    if not pd.api.types.is_datetime64_any_dtype(df['INCEPTION DATE']):
+        if date_mode == "mixed":
+            df['INCEPTION DATE'] = pd.to_datetime(df['INCEPTION DATE'], format='mixed', dayfirst=True, errors='coerce')
+        else:
+            df['INCEPTION DATE'] = pd.to_datetime(df['INCEPTION DATE'], format='%d/%m/%Y', errors='coerce')
+    latest_date = df['INCEPTION DATE'].max()
+    if pd.isna(latest_date):
+        return df, None
+    return df, (latest_date + MonthEnd(0)).date()
+
+
+def parse_expiry_dates(df, date_mode="strict"):
+    """Parsing EXPIRY DATE, mengembalikan ``(df, baris tidak valid, laporan)``.
+
+    Laporan berasal dari ``dates.parse_dates`` (None jika kolom sudah bertipe
+    tanggal). Mode "strict" membuang baris tanpa tanggal valid; mode "mixed"
+    menyimpan nilai tidak valid sebagai string aslinya.
+    """
+    report = None
+    if not pd.api.types.is_datetime64_any_dtype(df['EXPIRY DATE']):
+        formats = dates.MIXED_FORMATS if date_mode == "mixed" else (dates.DAY_FIRST,)
+        parsed, report = dates.parse_dates(df['EXPIRY DATE'], formats)
+        if date_mode == "mixed":
+            valid = parsed.notna()
+            invalid_dates = df[~valid & df['EXPIRY DATE'].notna()]
+            # Tanggal valid menjadi date, nilai tidak valid tetap string asli, kosong tetap NaN
+            expiry = df['EXPIRY DATE'].astype(object)
+            expiry[valid] = parsed[valid].dt.date
+            df['EXPIRY DATE'] = expiry
+            return df, invalid_dates, report
+        df['EXPIRY DATE'] = parsed
+    elif date_mode == "mixed":
+        # Kolom bertipe tanggal (Parquet/XLSX): tidak ada string yang tidak valid, baris kosong tetap disimpan
+        df['EXPIRY DATE'] = df['EXPIRY DATE'].dt.date
+        return df, df.iloc[:0], report
+
+    missing = df['EXPIRY DATE'].isna().to_numpy()
+    invalid_dates = df[missing]
+    # Konversi ke date dan hapus NaT
+    df['EXPIRY DATE'] = df['EXPIRY DATE'].dt.date
+    return select_rows(df, ~missing), invalid_dates, report
+
+
+def select_rows(df, mask):
+    """Baris ``df`` dengan ``mask`` True, disalin sekali dan hanya jika perlu.
+
+    Jika semua baris lolos, ``df`` dikembalikan apa adanya. ``take`` tidak
+    menandai hasil sebagai potongan, jadi kolom bisa diubah tanpa salinan
+    tambahan (dan tanpa SettingWithCopyWarning).
+    """
+    mask = np.asarray(mask, dtype=bool)
+    if mask.all():
+        return df
+    return df.take(np.flatnonzero(mask))
+
+
+def expiry_datetimes(expiry):
+    # EXPIRY DATE sebagai datetime64; nilai yang bukan date (string tidak valid, kosong) menjadi NaT.
+    # Tipe hanya dicek pada nilai unik, lalu dipetakan kembali ke setiap baris
+    codes, uniques = pd.factorize(expiry)
+    is_date = np.fromiter((isinstance(value, datetime.date) for value in uniques), dtype=bool, count=len(uniques))
+    values = np.full(len(uniques) + 1, np.datetime64("NaT"), dtype="datetime64[ns]")  # kode -1 -> NaT
+    values[:-1][is_date] = pd.to_datetime(list(np.asarray(uniques, dtype=object)[is_date])).to_numpy()
+    return values[codes]
+
+
+def filter_by_expiry(df, selected_date):
+    # Hanya baris dengan EXPIRY DATE yang valid (date) yang dibandingkan; NaT selalu gagal
+    return select_rows(df, expiry_datetimes(df['EXPIRY DATE']) > np.datetime64(selected_date))
+
+
+# Fungsi untuk membersihkan kolom koordinat
+def clean_coordinate_column(series):
+    return (
+        series.astype(str)
+        .str.strip()
+        .str.replace("–", "-", regex=False)
+        .str.replace(",", ".", regex=False)
+        .str.replace(r"[^0-9\.-]", "", regex=True)
+    )
+
+
+def parse_coordinate_column(series):
+    # Bersihkan dan konversi hanya nilai unik, lalu petakan kembali ke setiap baris
+    codes, uniques = pd.factorize(series)
+    values = pd.to_numeric(clean_coordinate_column(pd.Series(uniques)), errors='coerce').to_numpy(dtype=float)
+    values = np.append(values, np.nan)  # kode -1 (kosong) -> NaN
+    return pd.Series(values[codes], index=series.index, name=series.name)
+
+
+def coordinate_status(lat, lon):
+    """Kode status per baris (lihat ``COORD_STATUS``) dari Latitude/Longitude numerik."""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    min_lon, min_lat, max_lon, max_lat = INDONESIA_BOUNDS
+
+    def in_bounds(x, y):
+        return (x >= min_lon) & (x <= max_lon) & (y >= min_lat) & (y <= max_lat)
+
+    # Urutan prioritas: kosong, nol, tertukar, di luar Indonesia
+    return np.select(
+        [
+            np.isnan(lat) | np.isnan(lon),
+            (lat == 0) | (lon == 0),
+            ~in_bounds(lon, lat) & in_bounds(lat, lon),
+            ~in_bounds(lon, lat),
+        ],
+        [COORD_MISSING, COORD_ZERO, COORD_SWAPPED, COORD_OUTSIDE],
+        default=COORD_OK,
+    ).astype(np.int8)
+
+
+def clean_coordinates(df):
+    """Bersihkan Latitude/Longitude dan periksa apakah masuk akal.
+
+    Mengembalikan ``(df, invalid_rows)``. ``invalid_rows`` berisi baris dengan
+    status selain OK ditambah kolom ``Status Koordinat``. Hanya baris kosong
+    yang tidak bisa di-join; baris lain tetap diproses apa adanya.
+    """
+    if LAT_COL not in df.columns or LON_COL not in df.columns:
+        raise PipelineError("Kolom 'Latitude' dan/atau 'Longitude' tidak ditemukan dalam data.")
+    for col in (LAT_COL, LON_COL):
+        # Kolom yang sudah numerik tidak perlu dibersihkan sebagai string
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = parse_coordinate_column(df[col])
+
+    status = coordinate_status(df[LAT_COL], df[LON_COL])
+    invalid_rows = df[status != COORD_OK].copy()
+    invalid_rows[COORD_STATUS_COL] = pd.Categorical.from_codes(
+        status[status != COORD_OK], categories=list(COORD_STATUS.values())
+    )
+    return df, invalid_rows
+
+
+def assign_risk(final, grid_col):
+    if grid_col:
+        final[RISK_COL] = final[grid_col].map(RISK_LABELS).fillna(NO_RISK)
+        # Beberapa layer bahaya: Kategori Risiko per layer, mis. "Kategori Risiko (Banjir)"
+        for layer, col in layer_grid_cols(final.columns, grid_col).items():
+            final[f"{RISK_COL} ({layer})"] = final[col].map(RISK_LABELS).fillna(NO_RISK)
+    return final
+
+
+def compute_rates(final, rate_table=None):
+    missing_cols = [col for col in (BUILDING_COL, FLOOR_COL) if col not in final.columns]
+    if missing_cols:
+        raise PipelineError(f"Kolom berikut tidak ditemukan dalam data: {', '.join(missing_cols)}")
+
+    final[FLOOR_COL] = pd.to_numeric(final[FLOOR_COL], errors='coerce')
+    final[FLOOR_COL] = final[FLOOR_COL].mask(final[FLOOR_COL] == 0, 1)
+
+    if rate_table is None:
+        rate_table = load_rate_table()
+    final[RATE_COL], rate_report = apply_rate_table(
+        final[RISK_COL], final[BUILDING_COL], final[FLOOR_COL], rate_table
+    )
+    return final, rate_report
+
+
+def clean_tsi_column(series):
+    return parse_money(series)
+
+
+def compute_pml(final):
+    if RATE_COL not in final.columns or TSI_COL not in final.columns:
+        raise PipelineError(f"Kolom {RATE_COL} dan/atau {TSI_COL} tidak ditemukan dalam data.")
+
+    final[TSI_COL] = clean_tsi_column(final[TSI_COL])
+    final[PML_COL] = final[TSI_COL] * final[RATE_COL]
+
+    if KODE_OKUPASI_COL in final.columns:
+        kode = final[KODE_OKUPASI_COL].str[:2].replace({
+            '#V': '00',
+            '#VALUE!': '00',
+            'na': '00',
+            'NaN': '00',
+            '4,': '41',
+            '4.': '41'
+        })
+        pos = final.columns.get_loc(KODE_OKUPASI_COL) + 1
+        final.insert(pos, KODE_OKUPASI_2_COL, kode)
+    return final
+
+
+def output_filename(uploaded_filename, ext):
+    # Nama file hasil mengikuti nama file upload
+    uploaded_filename = os.path.basename(uploaded_filename).lower()
+    if "jakarta" in uploaded_filename:
+        return f"Data Banjir Jakarta - After Computation.{ext}"
+    elif "all porto" in uploaded_filename:
+        return f"Data Banjir All Porto - After Computation.{ext}"
+    return f"Data Banjir - After Computation.{ext}"
+
+
+def prepare_portfolio(df, expiry_after=None, date_mode="strict"):
+    """Parsing tanggal, filter EXPIRY DATE dan pembersihan koordinat.
+
+    Mengembalikan ``(df, as_of_date, invalid_expiry, invalid_coordinates, date_report)``.
+    """
+    df, as_of_date = parse_inception_date(df, date_mode)
+
+    invalid_expiry = date_report = None
+    if 'EXPIRY DATE' in df.columns:
+        df, invalid_expiry, date_report = parse_expiry_dates(df, date_mode)
+        if expiry_after is not None:
+            df = filter_by_expiry(df, expiry_after)
+
+    df, invalid_coordinates = clean_coordinates(df)
+    return df, as_of_date, invalid_expiry, invalid_coordinates, date_report
+
+
+def score_portfolio(final, grid_col, rate_table=None, compact=True):
+    # Kategori Risiko, rate dan PML untuk data yang sudah di-join; mengembalikan (final, rate_report)
+    final = assign_risk(final, grid_col)
+
+    rate_report = None
+    if RISK_COL in final.columns:
+        final, rate_report = compute_rates(final, rate_table)
+    final = compute_pml(final)
+    return (compact_final(final) if compact else final), rate_report
+
+
+def compact_final(final):
+    # Tipe kolom hemat memori untuk hasil akhir (category, string Arrow, downcast)
+    return compact_dtypes(final, keep=FULL_PRECISION_COLS)
+
+
+def run_pipeline(portfolio, hazard_zips, expiry_after=None, date_mode="strict",
+                 rate_table=None, prefix="Total", hazard_cache_dir=DEFAULT_CACHE_DIR,
+                 workers=DEFAULT_WORKERS, memory_report=False):
+    """Jalankan seluruh rantai perhitungan tanpa Streamlit.
+
+    ``portfolio`` adalah path/buffer file portfolio (lihat ``load_portfolio``)
+    atau DataFrame, ``hazard_zips`` berisi pasangan ``(nama, bytes)`` dari
+    file zip shapefile. Layer bahaya dibaca lewat cache GeoParquet di
+    ``hazard_cache_dir`` (None = tanpa cache), beberapa zip sekaligus dengan
+    ``workers`` proses, lalu semua layer di-join sekaligus ke satu index
+    titik. Gridcode lokasi yang sudah pernah di-join diambil dari
+    ``LocationStore`` di folder yang sama (jumlah hit/miss di
+    ``location_stats``). Dengan ``memory_report=True`` ukuran data (MB)
+    dicatat setelah setiap tahap.
+    """
+    if date_mode not in DATE_MODES:
+        raise PipelineError(f"date_mode harus salah satu dari {DATE_MODES}")
+
+    report = [] if memory_report else None
+
+    def track(stage, frame):
+        if report is not None:
+            report.append(memory_entry(stage, frame))
+
+    df = portfolio.copy() if isinstance(portfolio, pd.DataFrame) else load_portfolio(portfolio)
+    track("load", df)
+    df, as_of_date, invalid_expiry, invalid_coordinates, date_report = prepare_portfolio(
+        df, expiry_after, date_mode
+    )
+    track("prepare", df)
+
+    reader = functools.partial(load_hazard_zip, cache_dir=hazard_cache_dir)
+    store = LocationStore(hazard_cache_dir) if hazard_cache_dir else None
+    final, grid_col, hazard_issues = spatial_join_zips(
+        df, hazard_zips, reader=reader, store=store, workers=workers
+    )
+    if store:
+        store.flush()
+    if final is None:
+        raise PipelineError("Tidak ada shapefile yang berhasil diproses.")
+    del df
+    track("join", final)
+
+    final, rate_report = score_portfolio(final, grid_col, rate_table, compact=False)
+    track("score", final)
+    final = compact_final(final)
+    track("compact", final)
+    cube = summaries.build_cube(final)
+
+    return PipelineResult(
+        final=final,
+        grid_col=grid_col,
+        as_of_date=as_of_date,
+        invalid_coordinates=invalid_coordinates,
+        invalid_expiry=invalid_expiry,
+        date_report=date_report,
+        hazard_issues=hazard_issues,
+        rate_report=rate_report,
+        summaries=summaries.summaries_from_cube(cube, prefix=prefix),
+        cube=cube,
+        memory_report=report,
+        location_stats=store.stats if store else None,
+    )
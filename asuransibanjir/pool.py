@@ -0,0 +1,36 @@
+# Process pool bersama untuk pekerjaan paralel (parsing zip layer bahaya, batch tahun simulasi).
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Jumlah proses default untuk pekerjaan paralel
+DEFAULT_WORKERS = int(os.environ.get("ASURANSIBANJIR_WORKERS", os.cpu_count() or 1))
+
+# Pool dipakai ulang antar pemanggilan (antar rerun Streamlit) agar biaya start proses
+# hanya dibayar sekali
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """Process pool dengan ``workers`` proses; dibuat ulang hanya jika jumlahnya berubah."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn, bukan fork: aman dipanggil dari server Streamlit yang multi-thread
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def reset_pool():
+    # Buang pool yang rusak (BrokenProcessPool); pemanggilan berikutnya membuat pool baru
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
@@ -0,0 +1,141 @@
+# Profiler tahap pipeline (opt-in): waktu, jumlah baris masuk/keluar dan memori per tahap.
+#
+# Profiler aktif dipasang dengan ``activate``; kode tahap membungkus pekerjaannya
+# dengan ``track``. Tanpa profiler aktif ``track`` tidak mengukur apa pun.
+import contextlib
+import contextvars
+import datetime
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+# Interval pengambilan sampel RSS selama satu tahap berjalan (detik)
+SAMPLE_INTERVAL = 0.01
+
+_active = contextvars.ContextVar("asuransibanjir_profiler", default=None)
+
+
+def _rss_bytes():
+    # RSS proses saat ini dari /proc (Linux); None jika tidak tersedia
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _rows(value):
+    # Jumlah baris dari DataFrame, atau DataFrame pertama di dalam tuple hasil tahap
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, tuple):
+        for item in value:
+            if isinstance(item, pd.DataFrame):
+                return len(item)
+    return None
+
+
+class _PeakSampler:
+    # Thread yang membaca RSS berkala dan menyimpan nilai tertinggi
+
+    def __init__(self):
+        self.start = self.peak = _rss_bytes()
+        self._stop = threading.Event()
+        self._thread = None
+        if self.start is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self.peak = max(self.peak, _rss_bytes() or 0)
+
+    def stop(self):
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        end = _rss_bytes()
+        self.peak = max(self.peak, end or 0)
+        return end
+
+
+class _Step:
+    def __init__(self, rows_in):
+        self.rows_in = rows_in
+        self.rows_out = None
+
+    def output(self, value):
+        # Catat jumlah baris hasil tahap; mengembalikan value agar bisa dipakai langsung
+        self.rows_out = _rows(value)
+        return value
+
+
+class StageProfiler:
+    """Kumpulan catatan per tahap: waktu, baris masuk/keluar dan memori."""
+
+    def __init__(self):
+        self.records = []
+        self.run = 0
+
+    def new_run(self):
+        # Satu run = satu eksekusi script/pipeline; catatan run sebelumnya disimpan
+        self.run += 1
+
+    def add(self, record):
+        self.records.append(record)
+
+    def to_frame(self):
+        return pd.DataFrame(self.records)
+
+    def to_json(self):
+        return json.dumps({
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "stages": self.records,
+        }, indent=2)
+
+
+def activate(profiler):
+    """Pasang ``profiler`` (atau None) sebagai profiler aktif untuk konteks ini."""
+    _active.set(profiler)
+    return profiler
+
+
+def active():
+    return _active.get()
+
+
+@contextlib.contextmanager
+def track(stage, frame_in=None):
+    """Ukur satu tahap. ``frame_in`` menentukan baris masuk; panggil
+    ``step.output(hasil)`` untuk mencatat baris keluar.
+    """
+    profiler = _active.get()
+    step = _Step(_rows(frame_in))
+    if profiler is None:
+        yield step
+        return
+
+    sampler = _PeakSampler()
+    started = datetime.datetime.now()
+    start = time.perf_counter()
+    try:
+        yield step
+    finally:
+        seconds = time.perf_counter() - start
+        end = sampler.stop()
+        mb = lambda value: None if value is None or sampler.start is None else round(value / 1e6, 1)
+        profiler.add({
+            "run": profiler.run,
+            "stage": stage,
+            "started": started.isoformat(timespec="milliseconds"),
+            "seconds": round(seconds, 4),
+            "rows_in": step.rows_in,
+            "rows_out": step.rows_out,
+            "rss_start_mb": mb(sampler.start),
+            "peak_delta_mb": mb(None if sampler.start is None else sampler.peak - sampler.start),
+            "rss_delta_mb": mb(None if end is None else end - sampler.start),
+        })
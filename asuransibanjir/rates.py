@@ -0,0 +1,106 @@
+import json
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+RATE_TABLE_DIR = os.path.join(os.path.dirname(__file__), "rate_tables")
+DEFAULT_RATE_VERSION = "v1"
+
+
+@dataclass(frozen=True)
+class RateTable:
+    """Tabel rate dalam bentuk array 3 dimensi (risiko x okupasi x lantai)."""
+    version: str
+    risk_classes: tuple
+    occupancies: tuple
+    floor_buckets: tuple
+    rates: np.ndarray = field(repr=False)
+
+    def to_dict(self):
+        return {
+            risk: {
+                okupasi: {
+                    bucket: float(self.rates[i, j, k])
+                    for k, bucket in enumerate(self.floor_buckets)
+                }
+                for j, okupasi in enumerate(self.occupancies)
+            }
+            for i, risk in enumerate(self.risk_classes)
+        }
+
+
+def load_rate_table(path=None, version=DEFAULT_RATE_VERSION):
+    # Rate dibaca dari file konfigurasi berversi, bukan lagi dictionary inline
+    if path is None:
+        path = os.path.join(RATE_TABLE_DIR, f"rate_{version}.json")
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    floor_buckets = tuple(config["floor_buckets"])
+    if floor_buckets != ("1", "more_than_1"):
+        raise ValueError(f"floor_buckets tidak didukung: {floor_buckets}")
+
+    risk_classes = tuple(config["rates"])
+    occupancies = tuple(dict.fromkeys(
+        okupasi for per_risk in config["rates"].values() for okupasi in per_risk
+    ))
+
+    # Kombinasi yang tidak ada di konfigurasi diisi NaN
+    rates = np.full((len(risk_classes), len(occupancies), len(floor_buckets)), np.nan)
+    for i, risk in enumerate(risk_classes):
+        for j, okupasi in enumerate(occupancies):
+            per_floor = config["rates"][risk].get(okupasi, {})
+            for k, bucket in enumerate(floor_buckets):
+                if bucket in per_floor:
+                    rates[i, j, k] = per_floor[bucket]
+
+    return RateTable(
+        version=str(config.get("version", version)),
+        risk_classes=risk_classes,
+        occupancies=occupancies,
+        floor_buckets=floor_buckets,
+        rates=rates,
+    )
+
+
+def _unknown_counts(series, codes):
+    unknown = series[(codes < 0) & series.notna().to_numpy()]
+    return {str(k): int(v) for k, v in unknown.value_counts().items()}
+
+
+def apply_rate_table(risk, okupasi, floors, table=None):
+    """Hitung rate setiap polis dengan satu kali lookup array.
+
+    Mengembalikan ``(scaling, report)``. ``scaling`` bernilai NaN untuk baris
+    dengan risiko/okupasi yang tidak dikenal atau jumlah lantai kosong, dan
+    ``report`` merangkum jumlah baris tersebut.
+    """
+    if table is None:
+        table = load_rate_table()
+
+    risk_codes = pd.Categorical(risk, categories=table.risk_classes).codes
+    okupasi_codes = pd.Categorical(okupasi, categories=table.occupancies).codes
+
+    floors = pd.to_numeric(floors, errors="coerce").to_numpy(dtype=float)
+    floor_missing = np.isnan(floors)
+    # Sama seperti aturan lama: int(lantai) == 1 -> '1', selain itu 'more_than_1'
+    floor_codes = np.where(np.trunc(floors) == 1, 0, 1)
+
+    valid = (risk_codes >= 0) & (okupasi_codes >= 0) & ~floor_missing
+    flat = (risk_codes.astype(np.int64) * len(table.occupancies) + okupasi_codes) * len(table.floor_buckets) + floor_codes
+    flat_rates = np.append(table.rates.ravel(), np.nan)
+    scaling = flat_rates[np.where(valid, flat, len(flat_rates) - 1)]
+
+    index = risk.index if isinstance(risk, pd.Series) else None
+    report = {
+        "rate_version": table.version,
+        "unknown_risk": _unknown_counts(pd.Series(risk, index=index), risk_codes),
+        "unknown_okupasi": _unknown_counts(pd.Series(okupasi, index=index), okupasi_codes),
+        "missing_risk": int(pd.isna(pd.Series(risk, index=index)).sum()),
+        "missing_okupasi": int(pd.isna(pd.Series(okupasi, index=index)).sum()),
+        "missing_floor": int(floor_missing.sum()),
+        "unrated": int((~valid).sum()),
+    }
+    return pd.Series(scaling, index=index, name="Scaling"), report
@@ -0,0 +1,183 @@
+# Simulasi stokastik kejadian banjir: year loss table (YLT) dan kurva exceedance probability.
+#
+# Model berbasis zona:
+# - Lokasi dikelompokkan ke zona (sel grid ZONE_CELL_DEG derajat). Hanya zona yang berisi
+#   lokasi di area bahaya (Kategori Risiko di EVENT_PARAMS) yang bisa terkena kejadian.
+# - Jumlah kejadian per tahun ~ Poisson(EVENTS_PER_ZONE_YEAR x jumlah zona); setiap
+#   kejadian mengenai satu zona acak.
+# - Di zona yang terkena, setiap lokasi kebanjiran dengan peluang sesuai Kategori Risiko,
+#   dan rasio kerusakannya ~ Beta dengan rata-rata = rate tabel (Scaling) dan CV per risiko.
+#   Jadi PML deterministik = TSI x Scaling adalah rata-rata kerugian saat lokasi kebanjiran.
+#
+# Tahun disimulasikan per batch YEAR_BATCH, masing-masing dengan generator sendiri dari
+# SeedSequence(seed), sehingga hasil sama persis berapa pun jumlah worker.
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from .pipeline import PML_COL, RATE_COL, RISK_COL, TSI_COL
+from .pool import DEFAULT_WORKERS, get_pool, reset_pool
+from .spatial import LAT_COL, LON_COL, location_ids
+
+ZONE_CELL_DEG = 0.1
+EVENTS_PER_ZONE_YEAR = 0.1
+# Kategori Risiko -> (peluang lokasi kebanjiran saat zonanya terkena, CV rasio kerusakan)
+EVENT_PARAMS = {
+    "Rendah": (0.05, 1.0),
+    "Sedang": (0.15, 0.8),
+    "Tinggi": (0.35, 0.6),
+}
+SIMULATION_MODES = ("location", "policy")
+DEFAULT_YEARS = 10_000
+DEFAULT_SEED = 0
+YEAR_BATCH = 1_000
+# Batas pasangan (kejadian, lokasi) yang diproses sekaligus
+PAIR_BUDGET = 5_000_000
+RETURN_PERIODS = (2, 5, 10, 25, 50, 100, 200, 250, 500, 1000)
+
+ZONE_COL = "Zona"
+YEAR_COL = "Tahun"
+EVENTS_COL = "Jumlah Kejadian"
+AGGREGATE_COL = "Loss Agregat"
+OCCURRENCE_COL = "Loss Okurensi"
+
+
+def simulation_exposure(final, by="location"):
+    """Eksposur untuk simulasi: satu baris per lokasi (``by="location"``) atau per polis.
+
+    Mode lokasi menggabungkan polis di koordinat yang sama (TSI dan PML
+    dijumlah), sehingga satu undian berlaku untuk semua polis di lokasi itu
+    dan memori sebanding jumlah lokasi, bukan jumlah polis. Baris tanpa
+    kemungkinan kerugian (No Risk, tanpa rate, TSI kosong) dibuang.
+    """
+    if by not in SIMULATION_MODES:
+        raise ValueError(f"by harus salah satu dari {SIMULATION_MODES}, bukan {by!r}")
+    tsi = np.nan_to_num(final[TSI_COL].to_numpy(dtype=float))
+    exposure = pd.DataFrame({
+        LON_COL: final[LON_COL].to_numpy(),
+        LAT_COL: final[LAT_COL].to_numpy(),
+        RISK_COL: final[RISK_COL].astype(object).to_numpy(),
+        TSI_COL: tsi,
+        PML_COL: tsi * np.nan_to_num(final[RATE_COL].to_numpy(dtype=float)),
+    })
+    exposure = exposure[exposure[RISK_COL].isin(list(EVENT_PARAMS)) & (exposure[PML_COL] > 0)]
+    if exposure.empty:
+        # Tanpa eksposur: factorize pada MultiIndex kosong gagal, simulate_losses menangani zona kosong
+        return exposure.assign(**{ZONE_COL: np.empty(0, dtype=int)}).reset_index(drop=True)
+
+    if by == "location":
+        loc_id, _ = location_ids(exposure)
+        exposure = exposure.groupby(loc_id, sort=False).agg({
+            LON_COL: "first", LAT_COL: "first", RISK_COL: "first", TSI_COL: "sum", PML_COL: "sum",
+        })
+
+    cells = pd.MultiIndex.from_arrays([
+        np.floor(exposure[LON_COL].to_numpy(dtype=float) / ZONE_CELL_DEG),
+        np.floor(exposure[LAT_COL].to_numpy(dtype=float) / ZONE_CELL_DEG),
+    ])
+    exposure[ZONE_COL] = pd.factorize(cells)[0]
+    return exposure.sort_values(ZONE_COL, kind="stable").reset_index(drop=True)
+
+
+def _beta_params(mean, cv):
+    # Parameter Beta dari rata-rata dan koefisien variasi; variansi dibatasi agar a, b > 0
+    concentration = np.maximum((1 - mean) / (cv ** 2 * mean) - 1, 1e-3)
+    return mean * concentration, (1 - mean) * concentration
+
+
+def _simulate_batch(model, years, seed_seq):
+    # Kerugian per tahun untuk satu batch tahun: (jumlah kejadian, agregat, okurensi)
+    zone_start, zone_len, tsi, flood_prob, alpha, beta, event_rate = model
+    rng = np.random.default_rng(seed_seq)
+
+    counts = rng.poisson(event_rate, size=years)
+    event_year = np.repeat(np.arange(years), counts)
+    event_zone = rng.integers(len(zone_len), size=len(event_year))
+    event_loss = np.zeros(len(event_year))
+
+    # Kejadian diproses per potongan agar jumlah pasangan (kejadian, lokasi) <= PAIR_BUDGET
+    pair_end = np.cumsum(zone_len[event_zone])
+    start = 0
+    while start < len(event_year):
+        offset = pair_end[start - 1] if start else 0
+        stop = max(int(np.searchsorted(pair_end, offset + PAIR_BUDGET, side="right")), start + 1)
+        lens = zone_len[event_zone[start:stop]]
+        first = np.repeat(zone_start[event_zone[start:stop]] - (np.cumsum(lens) - lens), lens)
+        loc = first + np.arange(lens.sum())
+        pair_event = np.repeat(np.arange(start, stop), lens)
+
+        flooded = rng.random(len(loc)) < flood_prob[loc]
+        loc, pair_event = loc[flooded], pair_event[flooded]
+        loss = tsi[loc] * rng.beta(alpha[loc], beta[loc])
+        event_loss[start:stop] = np.bincount(pair_event - start, weights=loss, minlength=stop - start)
+        start = stop
+
+    occurrence = np.zeros(years)
+    np.maximum.at(occurrence, event_year, event_loss)
+    return counts, np.bincount(event_year, weights=event_loss, minlength=years), occurrence
+
+
+def simulate_losses(exposure, years=DEFAULT_YEARS, seed=DEFAULT_SEED, event_params=None,
+                    events_per_zone_year=EVENTS_PER_ZONE_YEAR, workers=DEFAULT_WORKERS):
+    """Simulasikan ``years`` tahun kejadian banjir untuk ``exposure`` (lihat ``simulation_exposure``).
+
+    Mengembalikan year loss table: Tahun, Jumlah Kejadian, Loss Agregat
+    (jumlah semua kejadian dalam setahun) dan Loss Okurensi (kejadian
+    terbesar dalam setahun). Batch tahun dijalankan paralel di process pool
+    bersama (lihat ``pool.get_pool``).
+    """
+    event_params = EVENT_PARAMS if event_params is None else event_params
+    params = exposure[RISK_COL].map(event_params)
+    flood_prob = params.str[0].to_numpy(dtype=float)
+    tsi = exposure[TSI_COL].to_numpy(dtype=float)
+    mean_ratio = np.clip(exposure[PML_COL].to_numpy(dtype=float) / tsi, 1e-9, 1 - 1e-9)
+    alpha, beta = _beta_params(mean_ratio, params.str[1].to_numpy(dtype=float))
+
+    zone_len = np.bincount(exposure[ZONE_COL].to_numpy(), minlength=0)
+    zone_start = np.cumsum(zone_len) - zone_len
+    event_rate = events_per_zone_year * len(zone_len)
+    model = (zone_start, zone_len, tsi, flood_prob, alpha, beta, event_rate)
+
+    bounds = list(range(0, years, YEAR_BATCH))
+    seeds = np.random.SeedSequence(seed).spawn(len(bounds))
+    batch_years = [min(YEAR_BATCH, years - start) for start in bounds]
+    results = None
+    if len(zone_len) == 0:
+        results = [(np.zeros(n, dtype=np.int64), np.zeros(n), np.zeros(n)) for n in batch_years]
+    elif workers > 1 and len(bounds) > 1:
+        try:
+            pool = get_pool(workers)
+            results = list(pool.map(_simulate_batch, [model] * len(bounds), batch_years, seeds))
+        except BrokenProcessPool:
+            # Worker mati (mis. kehabisan memori): ulangi secara berurutan
+            reset_pool()
+    if results is None:
+        results = [_simulate_batch(model, n, seed_seq) for n, seed_seq in zip(batch_years, seeds)]
+
+    counts, aggregate, occurrence = (np.concatenate(parts) for parts in zip(*results))
+    return pd.DataFrame({
+        YEAR_COL: np.arange(1, years + 1),
+        EVENTS_COL: counts,
+        AGGREGATE_COL: aggregate,
+        OCCURRENCE_COL: occurrence,
+    })
+
+
+def ep_curve(ylt, return_periods=RETURN_PERIODS):
+    """Kerugian per return period: OEP dari Loss Okurensi, AEP dari Loss Agregat.
+
+    Return period yang lebih panjang dari jumlah tahun simulasi dilewati.
+    """
+    return_periods = [rp for rp in return_periods if rp <= len(ylt)]
+    quantiles = [1 - 1 / rp for rp in return_periods]
+    return pd.DataFrame({
+        "Return Period (tahun)": return_periods,
+        "Probabilitas Terlampaui": [1 / rp for rp in return_periods],
+        "OEP": np.quantile(ylt[OCCURRENCE_COL].to_numpy(), quantiles),
+        "AEP": np.quantile(ylt[AGGREGATE_COL].to_numpy(), quantiles),
+    })
+
+
+def average_annual_loss(ylt):
+    return float(ylt[AGGREGATE_COL].mean())
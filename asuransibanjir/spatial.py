@@ -0,0 +1,278 @@
+import os
+import tempfile
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely import STRtree
+
+from .pool import DEFAULT_WORKERS, get_pool, reset_pool
+
+LON_COL = "Longitude"
+LAT_COL = "Latitude"
+GRIDCODE_KEYWORDS = ['gridcode', 'hasil_gridcode', 'kode_grid']
+# attrs layer berisi identitas isi zip, diisi oleh hazard_cache.load_hazard_zip
+LAYER_KEY_ATTR = "zip_digest"
+
+
+def read_hazard_zip(shapefile_bytes):
+    # Mengembalikan GeoDataFrame dari zip shapefile, atau None jika tidak ada .shp
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with zipfile.ZipFile(BytesIO(shapefile_bytes), 'r') as zip_ref:
+            zip_ref.extractall(tmpdir)
+
+        shp_path = None
+        for root, _, files in os.walk(tmpdir):
+            for file in files:
+                if file.endswith(".shp") and not file.startswith("._") and "__MACOSX" not in root:
+                    shp_path = os.path.join(root, file)
+
+        if not shp_path:
+            return None
+
+        gdf_shape = gpd.read_file(shp_path)
+        gdf_shape.columns = gdf_shape.columns.str.strip()
+        return gdf_shape
+
+
+def _read_layer(name, zip_bytes, reader):
+    # Mengembalikan (GeoDataFrame, None) atau (None, issue)
+    try:
+        gdf_shape = reader(zip_bytes)
+    except Exception as e:
+        return None, (name, "error", str(e))
+    if gdf_shape is None:
+        return None, (name, "missing", "Tidak ditemukan file .shp dalam ZIP")
+    if gdf_shape.crs is None:
+        return None, (name, "error", "Shapefile tidak memiliki CRS (.prj)")
+    return gdf_shape, None
+
+
+def load_hazard_layers(hazard_zips, reader=read_hazard_zip, workers=DEFAULT_WORKERS):
+    """Baca setiap zip ``(nama, bytes)`` menjadi layer bahaya.
+
+    Mengembalikan ``(layers, issues)`` sesuai urutan upload: ``layers`` berisi
+    ``(nama, GeoDataFrame)`` dan ``issues`` berisi ``(nama, "missing" | "error", pesan)``.
+    Beberapa zip diekstrak dan di-parse paralel di process pool bersama;
+    ``reader`` harus fungsi level modul (atau partial-nya) agar bisa dikirim
+    ke proses worker.
+    """
+    results = None
+    if workers > 1 and len(hazard_zips) > 1:
+        try:
+            pool = get_pool(workers)
+            futures = [pool.submit(_read_layer, name, zip_bytes, reader) for name, zip_bytes in hazard_zips]
+            results = [future.result() for future in futures]
+        except BrokenProcessPool:
+            # Worker mati (mis. kehabisan memori): ulangi secara berurutan
+            reset_pool()
+    if results is None:
+        results = [_read_layer(name, zip_bytes, reader) for name, zip_bytes in hazard_zips]
+
+    layers, issues = [], []
+    for (name, _), (gdf_shape, issue) in zip(hazard_zips, results):
+        if issue:
+            issues.append(issue)
+        else:
+            layers.append((name, gdf_shape))
+    return layers, issues
+
+
+def location_ids(df):
+    """Beri id integer untuk setiap koordinat unik.
+
+    Mengembalikan ``(loc_id, locations)``: ``loc_id`` adalah array sepanjang
+    ``df`` dan ``locations`` berisi Longitude/Latitude unik dengan index = id.
+    """
+    if len(df) == 0:
+        # factorize pada MultiIndex kosong gagal (TypeError)
+        return np.empty(0, dtype=int), pd.DataFrame({LON_COL: np.empty(0), LAT_COL: np.empty(0)})
+    coords = pd.MultiIndex.from_arrays([df[LON_COL].to_numpy(), df[LAT_COL].to_numpy()])
+    loc_id, uniques = pd.factorize(coords, use_na_sentinel=False)
+    locations = pd.DataFrame({
+        LON_COL: uniques.get_level_values(0).to_numpy(),
+        LAT_COL: uniques.get_level_values(1).to_numpy(),
+    })
+    return loc_id, locations
+
+
+def build_points(locations):
+    # Koordinat kosong tidak ikut di-join
+    locations = locations.dropna(subset=[LON_COL, LAT_COL])
+    return gpd.GeoDataFrame(
+        index=locations.index,
+        geometry=gpd.points_from_xy(locations[LON_COL], locations[LAT_COL]),
+        crs="EPSG:4326"
+    )
+
+
+def find_grid_col(columns):
+    gridcode_cols = [col for col in columns if any(kw in col.lower() for kw in GRIDCODE_KEYWORDS)]
+    return gridcode_cols[0] if gridcode_cols else None
+
+
+class PointIndex:
+    """Titik lokasi portfolio yang dipakai bersama oleh semua layer bahaya.
+
+    Titik dibuat sekali. Proyeksi ke CRS layer dan STRtree-nya dibuat sekali
+    per CRS (biasanya hanya satu), lalu dipakai ulang oleh setiap layer dengan
+    CRS tersebut.
+    """
+
+    def __init__(self, locations):
+        self.points = build_points(locations)
+        self._projected = {}
+        self._trees = {}
+
+    def _points_in(self, crs):
+        key = crs.to_wkt()
+        if key not in self._projected:
+            self._projected[key] = np.asarray(self.points.to_crs(crs).geometry.values)
+        return key, self._projected[key]
+
+    def query(self, gdf_shape):
+        """Pasangan ``(id_lokasi, posisi_poligon)`` untuk setiap titik yang mengenai poligon layer."""
+        key, points = self._points_in(gdf_shape.crs)
+        if key not in self._trees:
+            self._trees[key] = STRtree(points)
+        # Poligon layer di-query ke STRtree titik: poligon besar pun hanya dites ke titik di bbox-nya
+        shape_pos, point_pos = self._trees[key].query(np.asarray(gdf_shape.geometry.values), predicate="intersects")
+        return self.points.index[point_pos], shape_pos
+
+
+def layer_name(name):
+    # "data/Banjir 100th.zip" -> "Banjir 100th"
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def layer_grid_col(grid_col, layer):
+    # Kolom gridcode per layer, mis. "gridcode (Banjir)"
+    return f"{grid_col} ({layer})"
+
+
+def layer_grid_cols(columns, grid_col):
+    """Kolom gridcode per layer di ``columns`` sebagai dict ``{layer: kolom}``."""
+    prefix = f"{grid_col} ("
+    return {col[len(prefix):-1]: col for col in columns if col.startswith(prefix) and col.endswith(")")}
+
+
+def layer_gridcodes(index, gdf_shape, grid_col):
+    # Gridcode per id lokasi; lokasi yang mengenai beberapa poligon memakai gridcode tertinggi
+    loc, shape_pos = index.query(gdf_shape)
+    codes = pd.Series(gdf_shape[grid_col].to_numpy()[shape_pos], index=loc).dropna()
+    return codes.groupby(level=0).max()
+
+
+def join_layers(locations, layers, store=None):
+    """Join semua layer ``(nama, GeoDataFrame)`` ke ``locations`` dalam satu kali jalan.
+
+    Mengembalikan ``(hazard, grid_col, issues)``. ``hazard`` berisi gridcode
+    per id lokasi: kolom ``grid_col`` adalah gridcode tertinggi dari semua
+    layer, dan jika ada lebih dari satu layer juga satu kolom per layer
+    (lihat ``layer_grid_col``). Nama kolom gabungan mengikuti layer pertama.
+
+    Dengan ``store`` (``hazard_cache.LocationStore``), gridcode lokasi yang
+    sudah pernah di-join ke layer yang sama diambil dari store; hanya lokasi
+    baru yang masuk ``PointIndex``, dan hasilnya ditambahkan ke store.
+    """
+    targets = []
+    for name, gdf_shape in layers:
+        shape_grid_col = find_grid_col(gdf_shape.columns)
+        if not shape_grid_col:
+            continue
+        layer = layer_name(name)
+        while layer in [target[0] for target in targets]:
+            layer += "_"
+        digest = gdf_shape.attrs.get(LAYER_KEY_ATTR) if store is not None else None
+        targets.append((layer, name, gdf_shape, shape_grid_col, digest))
+
+    located = locations.dropna(subset=[LON_COL, LAT_COL])
+    pending = np.ones(len(located), dtype=bool)
+    keys, stored = None, {}
+    if any(target[4] for target in targets):
+        keys = store.location_keys(located[LON_COL].to_numpy(), located[LAT_COL].to_numpy())
+        pending[:] = False
+        for layer, _, _, _, digest in targets:
+            if digest:
+                stored[layer] = store.lookup(digest, keys)
+                pending |= ~stored[layer][0]
+            else:
+                pending[:] = True
+        store.stats["hits"] += int((~pending).sum())
+        store.stats["misses"] += int(pending.sum())
+    index = PointIndex(located[pending]) if pending.any() else None
+
+    per_layer, issues = {}, []
+    grid_col = None
+    for layer, name, gdf_shape, shape_grid_col, digest in targets:
+        try:
+            if index is not None:
+                codes = layer_gridcodes(index, gdf_shape, shape_grid_col)
+            else:
+                codes = pd.Series(dtype=gdf_shape[shape_grid_col].dtype)
+        except Exception as e:
+            issues.append((name, "error", str(e)))
+            continue
+        if layer in stored:
+            known, known_codes = stored[layer]
+            new_ids = located.index[~known]
+            new_codes = codes.reindex(new_ids)
+            if len(new_ids):
+                # Lokasi tanpa hit juga disimpan (NaN) agar tidak di-join ulang
+                store.update(digest, keys[~known], new_codes.to_numpy())
+            codes = pd.concat([
+                pd.Series(known_codes[known], index=located.index[known]).dropna(),
+                new_codes.dropna(),
+            ])
+        per_layer[layer] = codes
+        grid_col = grid_col or shape_grid_col
+
+    if not per_layer:
+        return None, None, issues
+    hazard = pd.DataFrame({grid_col: pd.concat(per_layer.values()).groupby(level=0).max()})
+    if len(per_layer) > 1:
+        for layer, codes in per_layer.items():
+            hazard[layer_grid_col(grid_col, layer)] = codes
+    return hazard, grid_col, issues
+
+
+def _broadcast(df, loc_id, locations, hazard):
+    # Index baru tanpa menyalin data kolom; kolom gridcode hanya ditambahkan di final
+    final = df.set_axis(pd.RangeIndex(len(df)), axis=0, copy=False)
+    if hazard is not None:
+        # Broadcast hasil per lokasi ke setiap polis lewat id lokasi
+        for col in hazard.columns:
+            final[col] = hazard[col].reindex(locations.index).to_numpy()[loc_id]
+    return final
+
+
+def _spatial_join(df, layers, store=None):
+    loc_id, locations = location_ids(df)
+    hazard, grid_col, issues = join_layers(locations, layers, store)
+    return _broadcast(df, loc_id, locations, hazard), grid_col, issues
+
+
+def spatial_join(df, layers, store=None):
+    # Gabungkan titik portfolio dengan layer yang sudah dibaca, mengembalikan (final, grid_col)
+    final, grid_col, _ = _spatial_join(df, layers, store)
+    return final, grid_col
+
+
+def spatial_join_zips(df, hazard_zips, reader=read_hazard_zip, store=None, workers=DEFAULT_WORKERS):
+    """Seperti ``spatial_join`` tetapi langsung dari zip ``(nama, bytes)``.
+
+    Nama zip (tanpa ekstensi) menjadi nama layer. Mengembalikan
+    ``(final, grid_col, issues)``; ``final`` None jika tidak ada zip yang
+    berhasil dibaca. Zip dibaca dengan ``workers`` proses (lihat
+    ``load_hazard_layers``) lalu di-join di proses ini. ``store`` hanya
+    dipakai untuk layer dari ``hazard_cache.load_hazard_zip`` (lihat
+    ``join_layers``).
+    """
+    layers, issues = load_hazard_layers(hazard_zips, reader, workers)
+    if not layers:
+        return None, None, issues
+    final, grid_col, join_issues = _spatial_join(df, layers, store)
+    return final, grid_col, issues + join_issues
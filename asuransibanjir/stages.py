@@ -0,0 +1,212 @@
+# Tahapan pipeline yang di-cache untuk halaman Streamlit.
+#
+# Setiap tahap hanya bergantung pada key kecil yang dideklarasikan (id file upload,
+# mode tanggal, key shapefile, versi tabel rate, tanggal filter, ...) dan memanggil
+# tahap hulunya, sehingga perubahan satu input hanya menghitung ulang tahap hilir.
+# Argumen berawalan "_" (file upload) tidak di-hash; isinya sudah diwakili key.
+#
+# ingest -> parse_dates -> clean -> join -> rate -> pml -> (filter EXPIRY DATE) -> cube -> summaries/deck/download/accumulation/simulation
+# Filter EXPIRY DATE diterapkan pada baris yang sudah dihitung, jadi mengganti
+# tanggal filter tidak mengulang spatial join.
+#
+# Tahap yang menyimpan DataFrame seukuran portfolio (parse_dates .. pml) memakai
+# st.cache_resource: hasilnya dipakai bersama tanpa di-unpickle setiap rerun
+# (st.cache_data menyalin seluruh portfolio di setiap cache hit). Hasil tahap
+# tersebut hanya boleh dibaca; tahap yang mengubah kolom bekerja pada salinan.
+import hashlib
+import itertools
+
+import streamlit as st
+
+from . import export
+from .accumulation import accumulate_exposure
+from .hazard_cache import LocationStore, load_hazard_zip
+from .maps import build_deck
+from .pipeline import (
+    assign_risk, clean_coordinates, compact_final, compute_pml, compute_rates, filter_by_expiry,
+    load_portfolio, output_filename, parse_expiry_dates, parse_inception_date, portfolio_format,
+)
+from .profiler import StageProfiler, activate, track
+from .rates import load_rate_table
+from .simulation import simulate_losses, simulation_exposure
+from .spatial import spatial_join_zips
+from .summaries import build_cube, summaries_from_cube
+
+# Jumlah kombinasi input yang disimpan per tahap
+CACHE_ENTRIES = 4
+# Key session_state untuk profiler tahap
+PROFILER_STATE = "stage_profiler"
+
+
+def file_key(uploaded):
+    # file_id berubah setiap kali file diupload ulang, jadi isi file tidak perlu di-hash tiap rerun
+    return uploaded.name, getattr(uploaded, "file_id", None) or hashlib.sha256(uploaded.getvalue()).hexdigest()
+
+
+def hazard_key(shp_zips):
+    return tuple(file_key(shp_zip) for shp_zip in shp_zips)
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def ingest(key, _file):
+    _file.seek(0)
+    with track("ingest") as step:
+        return step.output(load_portfolio(_file, portfolio_format(key[0])))
+
+
+@st.cache_resource(max_entries=CACHE_ENTRIES, show_spinner=False)
+def parse_dates(key, date_mode, _file):
+    # Mengembalikan (df, as_of_date, invalid_dates, date_report); df dari ingest sudah salinan sendiri
+    df = ingest(key, _file)
+    with track("parse_dates", df) as step:
+        df, as_of_date = parse_inception_date(df, date_mode)
+        invalid_dates = date_report = None
+        if 'EXPIRY DATE' in df.columns:
+            df, invalid_dates, date_report = parse_expiry_dates(df, date_mode)
+        return step.output((df, as_of_date, invalid_dates, date_report))
+
+
+@st.cache_resource(max_entries=CACHE_ENTRIES, show_spinner=False)
+def clean(key, date_mode, _file):
+    # Mengembalikan (df, invalid_rows) untuk seluruh data (sebelum filter EXPIRY DATE)
+    df = parse_dates(key, date_mode, _file)[0].copy()
+    with track("clean", df) as step:
+        return step.output(clean_coordinates(df))
+
+
+@st.cache_resource(max_entries=CACHE_ENTRIES, show_spinner=False)
+def join(key, date_mode, hazards, _file, _shp_zips):
+    # Mengembalikan (final, grid_col, hazard_issues, location_stats); final None jika tidak ada zip yang berhasil
+    df = clean(key, date_mode, _file)[0]
+    with track("join", df) as step:
+        store = LocationStore()
+        final, grid_col, hazard_issues = spatial_join_zips(
+            df,
+            [(shp_zip.name, shp_zip.getvalue()) for shp_zip in _shp_zips],
+            reader=load_hazard_zip,
+            store=store,
+        )
+        store.flush()
+        if final is not None:
+            final = assign_risk(final, grid_col)
+        return step.output((final, grid_col, hazard_issues, store.stats))
+
+
+@st.cache_resource(max_entries=CACHE_ENTRIES, show_spinner=False)
+def rate(key, date_mode, hazards, rate_version, _file, _shp_zips):
+    # Mengembalikan (final, rate_report); rate_report None jika tidak ada Kategori Risiko
+    final = join(key, date_mode, hazards, _file, _shp_zips)[0]
+    if 'Kategori Risiko' not in final.columns:
+        return final, None
+    with track("rate", final) as step:
+        return step.output(compute_rates(final.copy(), load_rate_table(version=rate_version)))
+
+
+@st.cache_resource(max_entries=CACHE_ENTRIES, show_spinner=False)
+def pml(key, date_mode, hazards, rate_version, _file, _shp_zips):
+    final = rate(key, date_mode, hazards, rate_version, _file, _shp_zips)[0]
+    with track("pml", final) as step:
+        return step.output(compact_final(compute_pml(final.copy())))
+
+
+def apply_expiry_filter(df, selected_date):
+    # Tahap murah: dijalankan ulang setiap rerun, tanpa menyentuh tahap di atas
+    return df if selected_date is None else filter_by_expiry(df, selected_date)
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def cube(key, date_mode, hazards, rate_version, selected_date, _file, _shp_zips):
+    final = apply_expiry_filter(pml(key, date_mode, hazards, rate_version, _file, _shp_zips), selected_date)
+    with track("cube", final) as step:
+        return step.output(build_cube(final))
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def summaries(key, date_mode, hazards, rate_version, selected_date, prefix, _file, _shp_zips):
+    # Semua tabel ringkasan adalah roll-up dari cube, tanpa scan ulang final
+    data = cube(key, date_mode, hazards, rate_version, selected_date, _file, _shp_zips)
+    with track("summaries", data):
+        return summaries_from_cube(data, prefix)
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def accumulation(key, date_mode, hazards, rate_version, selected_date, _file, _shp_zips):
+    # Akumulasi Jumlah Polis/TSI/PML per lokasi untuk semua radius DEFAULT_RADII
+    final = apply_expiry_filter(pml(key, date_mode, hazards, rate_version, _file, _shp_zips), selected_date)
+    with track("accumulation", final) as step:
+        return step.output(accumulate_exposure(final))
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def simulation(key, date_mode, hazards, rate_version, selected_date, years, seed, by, _file, _shp_zips):
+    # Year loss table simulasi stokastik; seed tetap sehingga hasil bisa diulang
+    final = apply_expiry_filter(pml(key, date_mode, hazards, rate_version, _file, _shp_zips), selected_date)
+    with track("simulation", final) as step:
+        return step.output(simulate_losses(simulation_exposure(final, by), years, seed))
+
+
+# pdk.Deck tidak bisa di-pickle dengan utuh, jadi disimpan sebagai resource (tidak diubah oleh st.pydeck_chart)
+@st.cache_resource(max_entries=CACHE_ENTRIES, show_spinner=False)
+def deck(key, date_mode, hazards, rate_version, selected_date, fields, mode, zoom, center, _file, _shp_zips):
+    final = apply_expiry_filter(pml(key, date_mode, hazards, rate_version, _file, _shp_zips), selected_date)
+    fields = None if fields is None else list(fields)
+    with track("deck", final):
+        return build_deck(final, fields, mode, zoom, center)
+
+
+# cache_resource: bytes hasil unduhan dibagi tanpa disalin ulang setiap rerun (bytes tidak bisa diubah)
+@st.cache_resource(max_entries=CACHE_ENTRIES, show_spinner=False)
+def download(key, date_mode, hazards, rate_version, selected_date, fmt, prefix, _file, _shp_zips):
+    # Dibuat hanya saat diminta; mengembalikan (data, nama file, MIME)
+    final = apply_expiry_filter(pml(key, date_mode, hazards, rate_version, _file, _shp_zips), selected_date)
+    summary = None
+    if fmt == "xlsx":
+        summary = summaries(key, date_mode, hazards, rate_version, selected_date, prefix, _file, _shp_zips)
+    with track(f"download_{fmt}", final):
+        data = export.export_bytes(final, fmt, summary, archive_name=output_filename(key[0], "csv"))
+    _, ext, mime = export.DOWNLOAD_FORMATS[fmt]
+    return data, output_filename(key[0], ext), mime
+
+
+def _render_profile(profiler):
+    with profiler.panel.container():
+        with st.expander(f"⏱️ Profil tahap ({len(profiler.records)} catatan)"):
+            if not profiler.records:
+                st.caption("Belum ada tahap yang dihitung. Tahap yang diambil dari cache tidak dicatat.")
+            else:
+                st.dataframe(profiler.to_frame(), hide_index=True)
+            st.download_button(
+                "Unduh profil (JSON)", profiler.to_json(), "profil_tahap.json", "application/json",
+                # Panel digambar dua kali per run (awal dan akhir), key harus berbeda
+                key=f"profiler_json_{next(profiler.renders)}",
+            )
+
+
+def profiler_sidebar():
+    """Toggle profiler tahap di sidebar (opt-in).
+
+    Jika aktif, setiap tahap yang benar-benar dihitung (cache miss) dicatat:
+    waktu, baris masuk/keluar dan selisih memori. Catatan dari rerun sebelumnya
+    disimpan di session sampai toggle dimatikan. Panggil ``profiler_panel`` di
+    akhir halaman untuk menampilkan catatan run ini.
+    """
+    if not st.sidebar.toggle("Profiler tahap", key="profiler_enabled"):
+        st.session_state.pop(PROFILER_STATE, None)
+        return activate(None)
+    if PROFILER_STATE not in st.session_state:
+        st.session_state[PROFILER_STATE] = StageProfiler()
+    profiler = st.session_state[PROFILER_STATE]
+    profiler.new_run()
+    # Elemen Streamlit tidak boleh dibuat di dalam tahap yang di-cache, jadi panel
+    # digambar dari halaman: sekarang (catatan run sebelumnya, berguna jika halaman
+    # berhenti dengan st.stop) lalu lagi lewat profiler_panel
+    profiler.panel = st.sidebar.empty()
+    profiler.renders = itertools.count()
+    _render_profile(profiler)
+    return activate(profiler)
+
+
+def profiler_panel():
+    profiler = st.session_state.get(PROFILER_STATE)
+    if profiler is not None:
+        _render_profile(profiler)
@@ -0,0 +1,158 @@
+import contextlib
+import functools
+from dataclasses import dataclass, field
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from .dates import MAX_EXAMPLES
+from .hazard_cache import DEFAULT_CACHE_DIR, LocationStore, load_hazard_zip
+from .pipeline import (
+    DATE_MODES, PipelineError, apply_schema, load_portfolio, portfolio_format, prepare_portfolio,
+    score_portfolio,
+)
+from .pool import DEFAULT_WORKERS
+from .spatial import _spatial_join, layer_grid_cols, load_hazard_layers
+from . import export, summaries
+
+# Jumlah baris portfolio yang diproses sekaligus; puncak memori mengikuti angka ini
+DEFAULT_CHUNKSIZE = 200_000
+
+
+@dataclass
+class StreamingResult:
+    output_path: str
+    rows: int = 0
+    chunks: int = 0
+    grid_col: str = None
+    as_of_date: object = None
+    invalid_coordinates: pd.DataFrame = None
+    invalid_expiry: pd.DataFrame = None
+    date_report: dict = None
+    hazard_issues: list = field(default_factory=list)
+    rate_report: dict = None
+    summaries: dict = field(default_factory=dict)
+    cube: pd.DataFrame = None
+    location_stats: dict = None
+
+
+def read_portfolio_chunks(portfolio, chunksize=DEFAULT_CHUNKSIZE):
+    """Baca portfolio per potongan; nama kolom dan tipe disamakan seperti ``load_portfolio``.
+
+    CSV dibaca bertahap dan Parquet per record batch. Feather/XLSX tidak bisa
+    dibaca sebagian, jadi dibaca utuh lalu dipotong.
+    """
+    fmt = portfolio_format(portfolio)
+    if fmt == "csv":
+        with pd.read_csv(portfolio, chunksize=chunksize) as reader:
+            for chunk in reader:
+                chunk.columns = chunk.columns.str.strip()
+                yield apply_schema(chunk)
+    elif fmt == "parquet":
+        for batch in pq.ParquetFile(portfolio).iter_batches(batch_size=chunksize):
+            chunk = batch.to_pandas()
+            chunk.columns = chunk.columns.str.strip()
+            yield apply_schema(chunk)
+    else:
+        df = load_portfolio(portfolio, fmt)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize].copy()
+
+
+def merge_reports(a, b):
+    # Jumlahkan laporan per potongan (rate_report, date_report); nilai lain diambil dari potongan pertama
+    if a is None or b is None:
+        return a or b
+    merged = dict(a)
+    for key, value in b.items():
+        if isinstance(value, dict):
+            counts = dict(a[key])
+            for name, count in value.items():
+                counts[name] = counts.get(name, 0) + count
+            merged[key] = counts
+        elif isinstance(value, int):
+            merged[key] = a[key] + value
+        elif isinstance(value, list):
+            merged[key] = list(dict.fromkeys(a[key] + value))[:MAX_EXAMPLES]
+    return merged
+
+
+def _concat(frames):
+    frames = [frame for frame in frames if frame is not None]
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def run_pipeline_chunked(portfolio, hazard_zips, output_path, expiry_after=None, date_mode="strict",
+                         rate_table=None, prefix="Total", hazard_cache_dir=DEFAULT_CACHE_DIR,
+                         chunksize=DEFAULT_CHUNKSIZE, xlsx_path=None, workers=DEFAULT_WORKERS):
+    """Seperti ``run_pipeline`` tetapi portfolio dibaca per potongan.
+
+    Setiap potongan dibersihkan, di-join, diberi rate dan PML, lalu langsung
+    ditulis ke ``output_path`` (CSV), ke ``xlsx_path`` bila diisi, dan dilipat
+    ke cube ringkasan berjalan.
+    ``final`` tidak pernah ada utuh di memori; layer bahaya dibaca sekali.
+    Baris tidak valid dikumpulkan untuk dilaporkan. Semua potongan ditulis
+    dengan kolom potongan pertama, walaupun layer gagal di potongan lain.
+    """
+    if date_mode not in DATE_MODES:
+        raise PipelineError(f"date_mode harus salah satu dari {DATE_MODES}")
+
+    reader = functools.partial(load_hazard_zip, cache_dir=hazard_cache_dir)
+    layers, hazard_issues = load_hazard_layers(hazard_zips, reader, workers)
+    if not layers:
+        raise PipelineError("Tidak ada shapefile yang berhasil diproses.")
+
+    store = LocationStore(hazard_cache_dir) if hazard_cache_dir else None
+    result = StreamingResult(
+        output_path=output_path,
+        hazard_issues=hazard_issues,
+        location_stats=store.stats if store else None,
+    )
+    invalid_expiry, invalid_coordinates = [], []
+    columns = None
+    workbook = export.XlsxExport(xlsx_path) if xlsx_path else contextlib.nullcontext()
+    with open(output_path, "w", encoding="utf-8", newline="") as out, workbook:
+        for chunk in read_portfolio_chunks(portfolio, chunksize):
+            chunk, as_of_date, *invalid, date_report = prepare_portfolio(chunk, expiry_after, date_mode)
+            invalid_expiry.append(invalid[0])
+            invalid_coordinates.append(invalid[1])
+            result.date_report = merge_reports(result.date_report, date_report)
+            if as_of_date is not None and (result.as_of_date is None or as_of_date > result.as_of_date):
+                result.as_of_date = as_of_date
+            if chunk.empty:
+                continue
+
+            final, grid_col, join_issues = _spatial_join(chunk, layers, store)
+            result.hazard_issues.extend(issue for issue in join_issues if issue not in result.hazard_issues)
+            result.grid_col = result.grid_col or grid_col
+            if grid_col:
+                for col in [grid_col, *layer_grid_cols(final.columns, grid_col).values()]:
+                    if pd.api.types.is_numeric_dtype(final[col]):
+                        # Potongan tanpa lokasi yang meleset menghasilkan int; samakan agar CSV konsisten
+                        final[col] = final[col].astype(float)
+            # Tanpa compact_dtypes: potongan langsung ditulis lalu dibuang
+            final, rate_report = score_portfolio(final, grid_col, rate_table, compact=False)
+            result.rate_report = merge_reports(result.rate_report, rate_report)
+            if columns is None:
+                columns = list(final.columns)
+            else:
+                # Header CSV/XLSX berasal dari potongan pertama; kolom yang hilang diisi kosong
+                final = final.reindex(columns=columns)
+
+            final.to_csv(out, index=False, header=result.chunks == 0)
+            if xlsx_path:
+                workbook.write_data(final)
+            result.cube = summaries.merge_cubes(result.cube, summaries.build_cube(final))
+            result.rows += len(final)
+            result.chunks += 1
+        if store:
+            # Hasil join semua potongan ditulis ke store sekali
+            store.flush()
+
+        if result.cube is not None:
+            result.summaries = summaries.summaries_from_cube(result.cube, prefix=prefix)
+        if xlsx_path:
+            workbook.write_summaries(result.summaries)
+    result.invalid_expiry = _concat(invalid_expiry)
+    result.invalid_coordinates = _concat(invalid_coordinates)
+    return result
@@ -0,0 +1,121 @@
+import pandas as pd
+
+TSI_COL = "TSI IDR"
+PML_COL = "PML"
+KODE_OKUPASI_2_COL = "Kode Okupasi (2 digit awal)"
+
+# Dimensi dan ukuran cube ringkasan; semua tabel adalah roll-up dari cube ini
+CUBE_DIMS = ['UY', 'Kategori Okupasi', KODE_OKUPASI_2_COL, 'Kategori Risiko']
+CUBE_MEASURES = ['count', 'tsi', 'pml']
+
+
+def build_cube(final):
+    """Satu kali agregasi ``final`` per kombinasi dimensi ``CUBE_DIMS`` yang ada.
+
+    Hasilnya DataFrame datar: kolom dimensi lalu ``count`` (jumlah polis),
+    ``tsi`` dan ``pml``. Nilai dimensi yang kosong tetap disimpan sebagai
+    NaN sehingga total keseluruhan tidak berubah; roll-up membuangnya.
+    """
+    dims = [col for col in CUBE_DIMS if col in final.columns]
+    data = pd.DataFrame({
+        'count': 1,
+        'tsi': final[TSI_COL] if TSI_COL in final.columns else 0.0,
+        'pml': final[PML_COL] if PML_COL in final.columns else 0.0,
+    }, index=final.index)
+    if not dims:
+        return data.sum().to_frame().T
+    for col in dims:
+        data[col] = final[col]
+    cube = data.groupby(dims, dropna=False, observed=True)[CUBE_MEASURES].sum()
+    return cube.reset_index()
+
+
+def merge_cubes(a, b):
+    # Cube dari potongan data berbeda cukup dijumlahkan per kombinasi dimensi
+    if a is None:
+        return b
+    dims = [col for col in a.columns if col not in CUBE_MEASURES]
+    merged = pd.concat([a, b], ignore_index=True)
+    if not dims:
+        return merged.sum().to_frame().T
+    return merged.groupby(dims, dropna=False, observed=True)[CUBE_MEASURES].sum().reset_index()
+
+
+def rollup(cube, dims):
+    # Jumlahkan cube ke dimensi yang diminta; baris dengan dimensi kosong dibuang
+    return cube.groupby(dims, observed=True)[CUBE_MEASURES].sum()
+
+
+def summary_by(cube, key, prefix="Total"):
+    # Jumlah polis, TSI dan PML per kategori
+    return rollup(cube, [key]).reset_index().rename(columns={
+        'count': 'Jumlah Polis',
+        'tsi': f'{prefix} TSI',
+        'pml': f'{prefix} PML'
+    })
+
+
+def _to_int(pivot):
+    return pivot.fillna(0).astype(int)
+
+
+def pivot_uy(cube, columns):
+    # Pivot jumlah polis, TSI dan PML dengan index UY
+    totals = rollup(cube, ['UY'] + columns)
+    return {measure: _to_int(totals[measure].unstack(columns)) for measure in CUBE_MEASURES}
+
+
+# Fungsi pivot per Kode Okupasi
+def get_pivot(cube, measure='count', label=''):
+    pivot = _to_int(rollup(cube, [KODE_OKUPASI_2_COL, 'UY'])[measure].unstack('UY'))
+    pivot['Jenis'] = label
+    return pivot.reset_index()
+
+
+def pivot_kode_okupasi(cube, prefix="Total"):
+    urutan_jenis = ['Jumlah Polis', f'{prefix} TSI', 'PML']
+    combined = pd.concat([
+        get_pivot(cube, 'count', urutan_jenis[0]),
+        get_pivot(cube, 'tsi', urutan_jenis[1]),
+        get_pivot(cube, 'pml', urutan_jenis[2]),
+    ], ignore_index=True)
+
+    # Jadikan 'Jenis' bertipe kategorikal dengan urutan yang diinginkan
+    combined['Jenis'] = pd.Categorical(combined['Jenis'], categories=urutan_jenis, ordered=True)
+    combined = combined.sort_values(by=['Jenis', KODE_OKUPASI_2_COL])
+
+    # Pindahkan kolom 'Jenis' ke paling kiri
+    cols = ['Jenis'] + [col for col in combined.columns if col != 'Jenis']
+    combined = combined[cols]
+
+    uy_cols = combined.columns.difference(['Jenis', KODE_OKUPASI_2_COL])
+    combined['Total'] = combined[uy_cols].sum(axis=1)
+    return combined
+
+
+def summaries_from_cube(cube, prefix="Total"):
+    """Semua tabel ringkasan dalam bentuk numerik (belum diformat), dari cube."""
+    result = {}
+    if 'Kategori Risiko' in cube.columns:
+        distribution = rollup(cube, ['Kategori Risiko'])['count']
+        result["risk_distribution"] = (
+            distribution.sort_values(ascending=False, kind='stable')
+            .rename_axis('Kategori').reset_index(name='Jumlah')
+        )
+        result["by_risk"] = summary_by(cube, 'Kategori Risiko', prefix)
+    if 'UY' in cube.columns:
+        result["by_uy"] = summary_by(cube, 'UY', prefix)
+    if 'Kategori Okupasi' in cube.columns:
+        result["by_okupasi"] = summary_by(cube, 'Kategori Okupasi', prefix)
+    if 'UY' in cube.columns and 'Kategori Risiko' in cube.columns:
+        result["uy_risk"] = pivot_uy(cube, ['Kategori Risiko'])
+        if 'Kategori Okupasi' in cube.columns:
+            result["uy_okupasi_risk"] = pivot_uy(cube, ['Kategori Okupasi', 'Kategori Risiko'])
+        if KODE_OKUPASI_2_COL in cube.columns:
+            result["kode_okupasi"] = pivot_kode_okupasi(cube, prefix)
+    return result
+
+
+def build_summaries(final, prefix="Total"):
+    # Satu kali scan final untuk cube, lalu semua tabel dari cube
+    return summaries_from_cube(build_cube(final), prefix)